@@ -9,6 +9,12 @@ __version__ = '0.5.3'
 from pymarket.bids.bids import *
 from pymarket.bids.demand_curves import *
 from pymarket.bids.processing import *
+from pymarket.bids.step_curve import *
+from pymarket.bids.aggregate_curve import *
+from pymarket.bids.binned_curves import *
 
 import pymarket.bids.demand_curves
 import pymarket.bids.processing
+import pymarket.bids.step_curve
+import pymarket.bids.aggregate_curve
+import pymarket.bids.binned_curves
@@ -0,0 +1,265 @@
+"""
+Aggregated demand and supply curves that are updated
+bid by bid over a discrete grid of prices.
+"""
+import numpy as np
+
+
+class FenwickTree(object):
+    """Binary indexed tree with the prefix sums of an array.
+
+    Updating a value and querying a prefix sum both
+    take :math:`O(\\log P)` operations, where `P` is the
+    size of the array.
+
+    Parameters
+    ----------
+    size : int
+        Number of elements of the array, all
+        initially 0.
+
+    Examples
+    ---------
+    >>> ft = FenwickTree(4)
+    >>> ft.add(1, 2.)
+    >>> ft.add(3, 1.)
+    >>> ft.prefix_sum(2), ft.prefix_sum(4), ft.total
+    (2.0, 3.0, 3.0)
+    """
+
+    __slots__ = ('size', 'tree', 'total')
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = np.zeros(size + 1)
+        self.total = 0.
+
+    def add(self, i, delta):
+        """Adds `delta` to the element `i`
+
+        Parameters
+        ----------
+        i : int
+            Position of the element.
+        delta : float
+            Value to add.
+        """
+        self.total += delta
+        i += 1
+        tree = self.tree
+        while i <= self.size:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, i):
+        """Sum of the first `i` elements
+
+        Parameters
+        ----------
+        i : int
+            Number of elements to add up.
+
+        Returns
+        -------
+        float
+            Sum of the elements in `[0, i)`.
+        """
+        s = 0.
+        tree = self.tree
+        while i > 0:
+            s += tree[i]
+            i -= i & -i
+        return float(s)
+
+
+class AggregateCurve(object):
+    """Demand and supply curves over a grid of prices
+    that can be updated after each bid.
+
+    The quantity offered at each price level is kept in a
+    Fenwick tree per side, so adding or cancelling a bid and
+    querying the quantity traded at a price take
+    :math:`O(\\log P)` operations, where `P` is the number of
+    price levels, and finding the clearing price takes
+    :math:`O(\\log^2 P)`. Prices are rounded to the closest
+    level of the grid.
+
+    Parameters
+    ----------
+    p_min : float
+        Smallest price of the grid.
+    p_max : float
+        Largest price of the grid.
+    tick : float
+        Distance between two consecutive prices
+        of the grid.
+
+    Attributes
+    ----------
+    tol : float
+        Quantities smaller than `tol` are treated as 0,
+        so that the residue left by cancelling bids with
+        float quantities does not count as a bid.
+
+    Examples
+    ---------
+    >>> ac = AggregateCurve(0, 10, 1)
+    >>> ac.add(2, 4, True)
+    >>> ac.add(1, 3, True)
+    >>> ac.add(2, 1, False)
+    >>> ac.add(2, 5, False)
+    >>> ac.demand_at(3), ac.supply_at(3)
+    (3.0, 2.0)
+    >>> ac.clearing_price()
+    4.0
+    >>> ac.cancel(2, 4, True)
+    >>> ac.clearing_price()
+    1.0
+    """
+
+    tol = 1e-9
+
+    def __init__(self, p_min, p_max, tick):
+        if tick <= 0 or p_max < p_min:
+            raise ValueError('The grid needs p_min <= p_max and tick > 0')
+        self.p_min = p_min
+        self.tick = tick
+        self.n_levels = int(np.round((p_max - p_min) / tick)) + 1
+        self.buy = FenwickTree(self.n_levels)
+        self.sell = FenwickTree(self.n_levels)
+
+    @classmethod
+    def from_bids(cls, bids, p_min, p_max, tick):
+        """Creates the aggregated curves of a collection of bids
+
+        Parameters
+        ----------
+        bids : pd.DataFrame
+            Collection of bids.
+        p_min : float
+            Smallest price of the grid.
+        p_max : float
+            Largest price of the grid.
+        tick : float
+            Distance between two consecutive prices of the grid.
+
+        Returns
+        -------
+        AggregateCurve
+            The curves with all the bids added.
+        """
+        ac = cls(p_min, p_max, tick)
+        for q, p, b in zip(bids.quantity.values, bids.price.values,
+                           bids.buying.values):
+            ac.add(q, p, b)
+        return ac
+
+    def level(self, price):
+        """Position in the grid of the closest price
+
+        Parameters
+        ----------
+        price : float
+            Price to locate.
+
+        Returns
+        -------
+        int
+            Price level of `price`.
+
+        Raises
+        ------
+        ValueError
+            If the price is outside of the grid.
+        """
+        level = int(np.round((price - self.p_min) / self.tick))
+        if level < 0 or level >= self.n_levels:
+            raise ValueError('Price {} is outside of the grid'.format(price))
+        return level
+
+    def price(self, level):
+        """Price of a level of the grid"""
+        return float(self.p_min + level * self.tick)
+
+    def add(self, quantity, price, buying=True):
+        """Adds a bid to the curves
+
+        Parameters
+        ----------
+        quantity : float
+            Quantity of the bid.
+        price : float
+            Price of the bid.
+        buying : bool
+            Side of the bid.
+        """
+        tree = self.buy if buying else self.sell
+        tree.add(self.level(price), quantity)
+
+    def cancel(self, quantity, price, buying=True):
+        """Removes a bid previously added to the curves
+
+        Parameters
+        ----------
+        quantity : float
+            Quantity of the bid.
+        price : float
+            Price of the bid.
+        buying : bool
+            Side of the bid.
+
+        Raises
+        ------
+        ValueError
+            If the quantity offered at the level of `price`
+            is smaller than `quantity`, meaning that the bid
+            was not added to this side of the curves.
+        """
+        tree = self.buy if buying else self.sell
+        level = self.level(price)
+        offered = tree.prefix_sum(level + 1) - tree.prefix_sum(level)
+        if quantity > offered + self.tol:
+            raise ValueError(
+                'There is no bid of quantity {} at price {} to cancel'.format(
+                    quantity, price))
+        tree.add(level, -quantity)
+
+    def _demand(self, level):
+        return self.buy.total - self.buy.prefix_sum(level)
+
+    def _supply(self, level):
+        return self.sell.prefix_sum(level + 1)
+
+    def demand_at(self, price):
+        """Total quantity of the buying bids with
+        a price greater or equal than `price`"""
+        return self._demand(self.level(price))
+
+    def supply_at(self, price):
+        """Total quantity of the selling bids with
+        a price smaller or equal than `price`"""
+        return self._supply(self.level(price))
+
+    def clearing_price(self):
+        """Smallest price of the grid at which the
+        supply covers the demand
+
+        Returns
+        -------
+        float or None
+            The clearing price, or None if there is no
+            price in the grid where the supply is greater or
+            equal than the demand, or one of the sides is empty.
+        """
+        if self.buy.total <= self.tol or self.sell.total <= self.tol:
+            return None
+        lo, hi = 0, self.n_levels
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._supply(mid) >= self._demand(mid) - self.tol:
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo == self.n_levels:
+            return None
+        return self.price(lo)
@@ -1,21 +1,66 @@
+import itertools
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
+
+from pymarket.utils.columns import ColumnStore, MemmapColumnStore
+
+__all__ = ['BidManager']
+
+# Unique identifier of each BidManager, used in its cache key
+_manager_ids = itertools.count()
 
 
 class BidManager(object):
     """A class used to store and manipulate a collection
     of all the bids in the market.
 
+    Bids are stored column-wise, each attribute in its own
+    growable numpy array, so that mechanisms can access them
+    without copying and without converting a list of tuples.
+
+    Bids can be cancelled or amended after being added. Cancelled
+    bids are only marked as such (tombstones) and are physically
+    removed from the arrays once they are a large enough fraction
+    of the stored bids (compaction). Bid identifiers never change.
+
+    If a `path` is given, the arrays are memory maps of files in
+    that directory, one per attribute, so that the bids do not need
+    to fit in memory. In that case, quantities, prices and times are
+    stored as `float64`, users as `int64`, and the manager should be
+    closed (or used as a context manager) when it is no longer needed.
+
+    Parameters
+    ----------
+    path : str or None
+        Directory for the files backing the arrays. If None, the
+        bids are kept in memory. Existing files are overwritten.
+
     Attributes
     -----------
     col_names : :obj:`list` of :obj:`str`
         Column names for the different attributes in the dataframe
         to be created. Currently and in order: `quantity`, `price`,
         `user`, `buying`, `time`, `divisible`.
+    col_dtypes : :obj:`list` of :obj:`str`
+        Dtype of each attribute when the bids are stored in files.
+    path : str or None
+        Directory with the files backing the arrays, if any.
     n_bids : int
-        Number of bids currently stored. Used as a unique identifier
-        for each bid within a BidManager.
+        Number of bids received, including cancelled ones.
+        Used as a unique identifier for each bid within a BidManager.
+    n_cancelled : int
+        Number of cancelled bids that were not yet removed
+        from the arrays.
+    compaction_ratio : float
+        Cancelled bids are removed from the arrays when they
+        represent more than this fraction of the stored bids.
+    version : int
+        Number of changes to the bids: it is increased each time
+        bids are added, cancelled or amended.
     bids : :obj:`list` of :obj:`tuple`
-        A list where all the recieved bids are stored.
+        A list with all the active bids. It is built from the
+        stored arrays on each access, prefer `get_arrays`.
     """
 
     col_names = [
@@ -27,9 +72,81 @@ class BidManager(object):
         'divisible',
     ]
 
-    def __init__(self):
+    col_dtypes = [
+        'float64',
+        'float64',
+        'int64',
+        'bool',
+        'float64',
+        'bool',
+    ]
+
+    compaction_ratio = 0.5
+
+    def __init__(self, path=None):
         self.n_bids = 0
-        self.bids = []
+        self.n_cancelled = 0
+        self.version = 0
+        self._id = next(_manager_ids)
+        names = self.col_names + ['bid', 'alive']
+        if path is None:
+            self._store = ColumnStore(names)
+        else:
+            dtypes = self.col_dtypes + ['int64', 'bool']
+            self._store = MemmapColumnStore(path, names, dtypes)
+        self.path = path
+        # Copy of the columns of the active bids, only
+        # needed while there are cancelled bids
+        self._alive = None
+        # Positions of the bids of each side sorted by price,
+        # number of stored bids already included and positions
+        # of the bids amended since then
+        self._order = {True: np.zeros(0, dtype='int64'),
+                       False: np.zeros(0, dtype='int64')}
+        self._order_size = {True: 0, False: 0}
+        self._amended = {True: set(), False: set()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def flush(self):
+        """Writes to disk all the pending changes
+        if the bids are stored in files.
+        """
+        self._store.flush()
+
+    def close(self):
+        """Flushes the changes and releases the files
+        backing the arrays, if any. The manager can not
+        be used afterwards.
+
+        Examples
+        ---------
+        >>> import tempfile
+        >>> with pm.BidManager(tempfile.mkdtemp()) as bm:
+        ...     bm.add_bid(2, 1, 0)
+        ...     bm.get_arrays()['quantity']
+        0
+        memmap([2.])
+        """
+        self._store.close()
+        self._alive = None
+
+    @property
+    def cache_key(self):
+        """Hashable key of the current active bids. It is
+        different for each manager and changes with `version`,
+        so it can be used to cache results computed from
+        the bids without hashing them."""
+        return (self._id, self.version)
+
+    @property
+    def bids(self):
+        columns = self._alive_columns()
+        return list(zip(*[columns[c].tolist() for c in self.col_names]))
 
     def add_bid(
         self,
@@ -74,13 +191,309 @@ class BidManager(object):
         0
         """
         new_bid = (quantity, price, user, buying, time, divisible)
-        self.bids.append(new_bid)
+        self._store.append(new_bid + (self.n_bids, True))
         self.n_bids += 1
+        self.version += 1
 
         return self.n_bids - 1
 
+    def add_bids(
+        self,
+        quantity,
+        price=None,
+        user=None,
+        buying=True,
+        time=0,
+        divisible=True
+    ):
+        """Appends a collection of bids at once.
+
+        The bids can be given as one array for each
+        attribute (scalars are used for all the bids),
+        as a dataframe with the same columns as `get_df`
+        or as a list of tuples with the arguments of `add_bid`.
+        All the bids are validated before any of them is added.
+
+        Parameters
+        ----------
+        quantity: np.ndarray, pd.DataFrame or list of tuples
+            Quantity of each bid. If it is a dataframe or a list
+            of tuples, it contains all the bids and the rest of the
+            parameters are ignored.
+        price: np.ndarray
+            Price of each bid.
+        user: np.ndarray
+            User submitting each bid.
+        buying: np.ndarray or bool
+            Side of each bid. Default is `True`.
+        time : np.ndarray or float
+            Instant at which each bid was made. Default is `0`.
+        divisible : np.ndarray or bool
+            Whether each bid is divisible. Default is `True`.
+
+        Returns
+        -------
+        range
+            Unique identifiers of the added bids.
+
+        Raises
+        ------
+        ValueError
+            If the attributes have different lengths, a
+            quantity is negative or NaN, a price is NaN or
+            `buying` or `divisible` are not boolean.
+
+        Examples
+        ---------
+        >>> bm = pm.BidManager()
+        >>> bm.add_bids([1, 2], [3, 1], [0, 1], [True, False])
+        range(0, 2)
+        >>> bm.add_bids([(1.5, 2, 2, False), (1, 4, 3)])
+        range(2, 4)
+        >>> bm.add_bids(bm.get_df().iloc[:1])
+        range(4, 5)
+        >>> bm.get_df()
+           quantity  price  user  buying  time  divisible
+        0       1.0      3     0    True     0       True
+        1       2.0      1     1   False     0       True
+        2       1.5      2     2   False     0       True
+        3       1.0      4     3    True     0       True
+        4       1.0      3     0    True     0       True
+        """
+        if isinstance(quantity, pd.DataFrame):
+            defaults = dict(buying=True, time=0, divisible=True)
+            values = [
+                quantity[c].values if c in quantity else defaults[c]
+                for c in self.col_names]
+        elif price is None and user is None:
+            values = _values_from_tuples(quantity)
+        else:
+            values = [quantity, price, user, buying, time, divisible]
+
+        values = _validate_bid_values(values)
+        n = values[0].shape[0]
+        first_id = self.n_bids
+        values.append(np.arange(first_id, first_id + n))
+        values.append(np.ones(n, dtype=bool))
+        self._store.extend(values)
+        self.n_bids += n
+        self.version += 1
+        return range(first_id, self.n_bids)
+
+    def _position(self, bid_id):
+        """Position in the arrays of an active bid"""
+        store = self._store
+        if store.size == self.n_bids:
+            pos = bid_id if 0 <= bid_id < store.size else store.size
+        else:
+            pos = np.searchsorted(store.view('bid'), bid_id)
+        if pos >= store.size or store.columns['bid'][pos] != bid_id \
+                or not store.columns['alive'][pos]:
+            raise KeyError('Bid {} does not exist or was cancelled'.format(
+                bid_id))
+        return pos
+
+    def cancel_bid(self, bid_id):
+        """Cancels a bid, which is ignored from then on.
+        The rest of the bids keep their identifier.
+
+        Parameters
+        ----------
+        bid_id : int
+            Unique identifier of the bid to cancel.
+
+        Raises
+        ------
+        KeyError
+            If the bid does not exist or was already cancelled.
+
+        Examples
+        ---------
+        >>> bm = pm.BidManager()
+        >>> bm.add_bid(2, 1, 0)
+        0
+        >>> bm.add_bid(1, 3, 1, buying=False)
+        1
+        >>> bm.add_bid(1, 2, 2)
+        2
+        >>> bm.cancel_bid(1)
+        >>> bm.get_df()
+           quantity  price  user  buying  time  divisible
+        0         2      1     0    True     0       True
+        2         1      2     2    True     0       True
+        """
+        pos = self._position(bid_id)
+        self._store.columns['alive'][pos] = False
+        self.n_cancelled += 1
+        self.version += 1
+        self._alive = None
+        if self.n_cancelled > self.compaction_ratio * self._store.size:
+            self.compact()
+
+    def amend_bid(self, bid_id, quantity=None, price=None):
+        """Modifies the quantity and/or the price of a bid,
+        keeping its identifier.
+
+        Parameters
+        ----------
+        bid_id : int
+            Unique identifier of the bid to modify.
+        quantity : float or None
+            New quantity of the bid, if None it is not modified.
+        price : float or None
+            New price of the bid, if None it is not modified.
+
+        Raises
+        ------
+        KeyError
+            If the bid does not exist or was cancelled.
+        ValueError
+            If the quantity is negative or NaN or the price is NaN.
+
+        Examples
+        ---------
+        >>> bm = pm.BidManager()
+        >>> bm.add_bid(2, 1, 0)
+        0
+        >>> bm.amend_bid(0, price=1.5)
+        >>> bm.get_df()
+           quantity  price  user  buying  time  divisible
+        0         2    1.5     0    True     0       True
+        """
+        pos = self._position(bid_id)
+        if quantity is not None and not quantity >= 0:
+            raise ValueError('Quantities must be non negative numbers')
+        if price is not None and np.isnan(price):
+            raise ValueError('Prices must be numbers')
+        if quantity is not None:
+            self._store.set(pos, 'quantity', quantity)
+        if price is not None:
+            self._store.set(pos, 'price', price)
+            self._mark_amended(pos)
+        self.version += 1
+        self._alive = None
+
+    def compact(self):
+        """Removes the cancelled bids from the arrays.
+        It is done automatically when cancelled bids are more
+        than `compaction_ratio` of the stored bids.
+        """
+        if self.n_cancelled == 0:
+            return
+        alive = self._store.view('alive').copy()
+        new_position = np.cumsum(alive) - 1
+        for side, order in self._order.items():
+            order = order[alive[order]]
+            self._order[side] = new_position[order]
+            covered = self._order_size[side]
+            self._order_size[side] = int(np.count_nonzero(alive[:covered]))
+            self._amended[side] = set(
+                int(new_position[p]) for p in self._amended[side]
+                if alive[p])
+        self._store.compact(alive)
+        self.n_cancelled = 0
+        self._alive = None
+
+    def _sort_key(self, buying, positions):
+        """Values that sort the bids of one side increasingly"""
+        price = self._store.columns['price'][positions]
+        return -price if buying else price
+
+    def _sorted_positions(self, buying):
+        """Positions of all the stored bids of one side sorted by
+        price, including the ones amended or added since the
+        last call."""
+        store = self._store
+        order = self._order[buying]
+        amended = self._amended[buying]
+        if len(amended) > 0:
+            moved = np.array(sorted(amended), dtype='int64')
+            order = order[~np.isin(order, moved)]
+            key = self._sort_key(buying, moved)
+            sort = np.argsort(key, kind='mergesort')
+            moved, key = moved[sort], key[sort]
+            keys = self._sort_key(buying, order)
+            lo = np.searchsorted(keys, key, side='left')
+            hi = np.searchsorted(keys, key, side='right')
+            # Bids with the same price are sorted by position
+            where = lo + np.array([
+                np.searchsorted(order[l: h], p)
+                for l, h, p in zip(lo, hi, moved)], dtype='int64')
+            order = np.insert(order, where, moved)
+            self._order[buying] = order
+            amended.clear()
+        start = self._order_size[buying]
+        if start < store.size:
+            new = np.arange(start, store.size)
+            new = new[store.columns['buying'][start: store.size] == buying]
+            key = self._sort_key(buying, new)
+            sort = np.argsort(key, kind='mergesort')
+            new, key = new[sort], key[sort]
+            where = np.searchsorted(
+                self._sort_key(buying, order), key, side='right')
+            order = np.insert(order, where, new)
+            self._order[buying] = order
+            self._order_size[buying] = store.size
+        return order
+
+    def _mark_amended(self, pos):
+        """Records that the price of a bid changed. It is moved
+        to its new place in the sorted index of its side the next
+        time the index is read, so amending a bid takes constant
+        time."""
+        buying = bool(self._store.columns['buying'][pos])
+        if pos < self._order_size[buying]:
+            self._amended[buying].add(int(pos))
+
+    def sorted_index(self, buying=True):
+        """Identifiers of the active bids of one side of the
+        market sorted by price: decreasingly for buying bids and
+        increasingly for selling bids. Bids with the same price
+        keep the order in which they were added.
+
+        The order is maintained incrementally: only the bids added
+        or amended since the last call are sorted and then merged
+        into the order of the rest.
+
+        Parameters
+        ----------
+        buying : bool
+            `True` for the buying side and `False` for the
+            selling side.
+
+        Returns
+        -------
+        np.ndarray
+            Identifiers of the bids, in order. Can be used as
+            the `order` of `demand_curve_from_bids` and
+            `supply_curve_from_bids`.
+
+        Examples
+        ---------
+        >>> bm = pm.BidManager()
+        >>> bm.add_bids([1, 2, 1, 3], [2, 3, 1, 3], [0, 1, 2, 3])
+        range(0, 4)
+        >>> bm.sorted_index(True)
+        array([1, 3, 0, 2])
+        >>> bm.add_bid(1, 2.5, 4)
+        4
+        >>> bm.amend_bid(1, price=0.5)
+        >>> bm.sorted_index(True)
+        array([3, 4, 0, 2, 1])
+        """
+        order = self._sorted_positions(buying)
+        if self.n_cancelled > 0:
+            order = order[self._store.columns['alive'][order]]
+        return self._store.columns['bid'][order]
+
     def get_df(self):
-        """Creates a dataframe with the bids
+        """Creates a dataframe with the bids.
+        The columns of the dataframe are read-only views of
+        the stored arrays, so no data is copied while there are
+        no cancelled bids. The dataframe reflects the bids
+        at the time of the call and is only valid until a
+        bid is amended or cancelled, take a copy to modify it
+        or to keep it.
 
         Parameters
         ----------
@@ -103,6 +516,124 @@ class BidManager(object):
         0         2      1     0    True     0       True
         1         1      3     1   False     0       True
         """
+        columns = self._alive_columns()
+        if self.n_cancelled == 0 and self._store.size == self.n_bids:
+            index = pd.RangeIndex(0, self.n_bids)
+        else:
+            index = pd.Index(columns['bid'])
+        data = OrderedDict((c, columns[c]) for c in self.col_names)
+        return pd.DataFrame(
+            data, columns=self.col_names, index=index, copy=False)
+
+    def _alive_columns(self):
+        """Read-only arrays with the attributes of the active
+        bids, including `bid`. They are views of the store if no bid
+        is cancelled and a cached copy of the active rows otherwise."""
+        store = self._store
+        names = self.col_names + ['bid']
+        if self.n_cancelled == 0:
+            columns = OrderedDict((c, store.view(c)) for c in names)
+        elif self._alive is not None and self._alive[0] == store.size:
+            return OrderedDict(self._alive[1])
+        else:
+            alive = store.view('alive')
+            columns = OrderedDict((c, store.view(c)[alive]) for c in names)
+            self._alive = (store.size, columns)
+        for values in columns.values():
+            values.flags.writeable = False
+        return OrderedDict(columns)
+
+    def get_arrays(self):
+        """Returns the active bids as numpy arrays, one for
+        each attribute. The arrays are read-only views of the
+        internal storage while there are no cancelled bids, and
+        a copy of the active rows otherwise. The stored bids
+        are never compacted by this call.
+
+        Parameters
+        ----------
+
+        Returns
+        -------
+        OrderedDict
+            Maping from each name in `col_names` to
+            the array with the values of that attribute,
+            plus `bid` with the identifier of each bid.
+
+        Examples
+        ---------
+        >>> bm = pm.BidManager()
+        >>> bm.add_bid(2, 1, 0)
+        0
+        >>> bm.add_bid(1.5, 3, 1, buying=False)
+        1
+        >>> arrays = bm.get_arrays()
+        >>> arrays['quantity']
+        array([2. , 1.5])
+        >>> arrays['buying']
+        array([ True, False])
+        """
+        return self._alive_columns()
+
+
+def _values_from_tuples(bids):
+    """Transposes a list of bid tuples into one list for each
+    attribute, filling missing trailing attributes with
+    the defaults of `add_bid`."""
+    defaults = (None, None, None, True, 0, True)
+    values = [[] for _ in defaults]
+    for bid in bids:
+        if len(bid) < 3:
+            raise ValueError('Bids need at least quantity, price and user')
+        bid = tuple(bid) + defaults[len(bid):]
+        for i, v in enumerate(bid):
+            values[i].append(v)
+    return values
+
+
+def _validate_bid_values(values):
+    """Checks a collection of bids given as one array for each
+    attribute and broadcasts the scalar attributes.
+
+    Parameters
+    ----------
+    values : list
+        Quantity, price, user, buying, time and divisible,
+        either as arrays or scalars.
+
+    Returns
+    -------
+    list of np.ndarray
+        One array for each attribute, all with the same length.
+    """
+    values = [np.asarray(v) for v in values]
+    lengths = set(v.shape[0] for v in values if v.ndim > 0)
+    if len(lengths) > 1:
+        raise ValueError(
+            'All the bid attributes must have the same length, '
+            'got lengths {}'.format(sorted(lengths)))
+    n = lengths.pop() if lengths else 1
+    values = [np.broadcast_to(v, (n,)) if v.ndim == 0 else v for v in values]
+    quantity, price, user, buying, time, divisible = values
+
+    for name, v in [('quantity', quantity), ('price', price)]:
+        if v.dtype.kind not in 'biuf':
+            raise ValueError('{} must be numeric'.format(name))
+    bad = np.isnan(quantity) | (quantity < 0)
+    if bad.any():
+        raise ValueError(
+            'Quantities must be non negative numbers, '
+            'invalid bids at positions {}'.format(np.flatnonzero(bad)))
+    bad = np.isnan(price)
+    if bad.any():
+        raise ValueError(
+            'Prices must be numbers, '
+            'invalid bids at positions {}'.format(np.flatnonzero(bad)))
 
-        df = pd.DataFrame(self.bids, columns=self.col_names)
-        return df
+    for i, name in [(3, 'buying'), (5, 'divisible')]:
+        v = values[i]
+        if v.dtype != bool:
+            if not np.isin(v, [0, 1]).all():
+                raise ValueError('{} must be boolean'.format(name))
+            values[i] = v.astype(bool)
+    return values
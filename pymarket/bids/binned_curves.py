@@ -0,0 +1,180 @@
+"""
+Approximate demand and supply curves for very large
+collections of bids, aggregated over a grid of prices.
+"""
+import numpy as np
+from collections import OrderedDict
+
+
+class BinnedCurves(object):
+    """Demand and supply curves where the bids are
+    aggregated in price bins.
+
+    Only the total quantity of each side in each bin is
+    stored, so the memory used does not depend on the number
+    of bids and the bids can be added in chunks. The bins are
+    given by their edges, which can be an uniform grid or,
+    for example, the quantiles of the prices of a sample of bids.
+
+    Parameters
+    ----------
+    edges : np.ndarray
+        Increasing edges of the bins. Bin `j` contains the prices
+        in `[edges[j], edges[j + 1])`, and the last one also
+        includes `edges[-1]`.
+
+    Attributes
+    -----------
+    buy : np.ndarray
+        Total quantity of the buying bids in each bin.
+    sell : np.ndarray
+        Total quantity of the selling bids in each bin.
+
+    Examples
+    ---------
+    >>> bm = pm.BidManager()
+    >>> bm.add_bids([1, 2, 5], [3, 4, 1], [0, 1, 2])
+    range(0, 3)
+    >>> bm.add_bids([4, 1, 5], [2, 1, 6], [3, 4, 5], False)
+    range(3, 6)
+    >>> bc = pm.bids.BinnedCurves(np.arange(0, 8))
+    >>> bc.add_bids(bm.get_df())
+    >>> bc.buy
+    array([0., 5., 0., 1., 2., 0., 0.])
+    >>> bc.clear()
+    OrderedDict([('price', 3.0), ('quantity', 2.0), ('price_error', 1.0), ('quantity_error', 1.0)])
+    """
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype='float64')
+        if self.edges.shape[0] < 2 or np.any(np.diff(self.edges) <= 0):
+            raise ValueError('The edges of the bins have to be increasing')
+        n_bins = self.edges.shape[0] - 1
+        self.buy = np.zeros(n_bins)
+        self.sell = np.zeros(n_bins)
+
+    def add(self, quantity, price, buying):
+        """Adds a chunk of bids
+
+        Parameters
+        ----------
+        quantity : np.ndarray
+            Quantity of each bid.
+        price : np.ndarray
+            Price of each bid.
+        buying : np.ndarray
+            Side of each bid.
+
+        Raises
+        ------
+        ValueError
+            If some price is outside of the edges.
+        """
+        quantity = np.asarray(quantity, dtype='float64')
+        price = np.asarray(price, dtype='float64')
+        buying = np.asarray(buying, dtype=bool)
+        n_bins = self.buy.shape[0]
+        bins = np.searchsorted(self.edges, price, side='right') - 1
+        bins[price == self.edges[-1]] = n_bins - 1
+        if np.any((bins < 0) | (bins >= n_bins)):
+            raise ValueError('Some prices are outside of the bins')
+        self.buy += np.bincount(
+            bins[buying], weights=quantity[buying], minlength=n_bins)
+        self.sell += np.bincount(
+            bins[~buying], weights=quantity[~buying], minlength=n_bins)
+
+    def add_bids(self, bids):
+        """Adds a chunk of bids given as a dataframe
+
+        Parameters
+        ----------
+        bids : pd.DataFrame
+            Collection of bids, as returned by `BidManager.get_df`.
+        """
+        self.add(bids.quantity.values, bids.price.values,
+                 bids.buying.values)
+
+    def curves(self, demand_position=0.5, supply_position=0.5):
+        """Stepwise demand and supply curves of the bins
+
+        Each non empty bin is a step, at a price inside the bin
+        given by its relative position: 0 for the lower edge and
+        1 for the upper edge.
+
+        Parameters
+        ----------
+        demand_position : float
+            Relative position of the prices of the demand curve.
+        supply_position : float
+            Relative position of the prices of the supply curve.
+
+        Returns
+        -------
+        demand : np.ndarray
+            Demand curve in the format of `demand_curve_from_bids`.
+        supply : np.ndarray
+            Supply curve in the format of `supply_curve_from_bids`.
+        """
+        width = np.diff(self.edges)
+        bins = np.flatnonzero(self.buy)[::-1]
+        demand = np.c_[
+            np.cumsum(self.buy[bins]),
+            self.edges[bins] + demand_position * width[bins]]
+        demand = np.vstack([demand, [np.inf, 0]])
+        bins = np.flatnonzero(self.sell)
+        supply = np.c_[
+            np.cumsum(self.sell[bins]),
+            self.edges[bins] + supply_position * width[bins]]
+        supply = np.vstack([supply, [np.inf, np.inf]])
+        return demand, supply
+
+    def clear(self):
+        """Clears the market on the binned curves
+
+        The clearing price is the smallest price of a bid at which
+        the supply covers the demand, and the quantity traded is the
+        smallest of both at that price. The demand and supply are known
+        exactly at the edges of the bins, which gives the range of bins
+        where the clearing price can be. The price returned is the
+        middle of that range and the error is half its width, so the
+        exact clearing price is always within the error; the same holds
+        for the quantity.
+
+        Returns
+        -------
+        OrderedDict
+            * price: the approximate clearing price, NaN if
+              one of the sides is empty
+            * quantity: the approximate quantity traded
+            * price_error: bound on the distance to the
+              exact clearing price
+            * quantity_error: bound on the distance to the
+              exact quantity traded
+        """
+        if self.buy.sum() <= 0 or self.sell.sum() <= 0:
+            return OrderedDict([
+                ('price', np.nan), ('quantity', 0.),
+                ('price_error', 0.), ('quantity_error', 0.)])
+
+        # Quantity of the buyers in or above each bin and of
+        # the sellers in or below each bin
+        buy_ge = np.cumsum(self.buy[::-1])[::-1]
+        buy_gt = buy_ge - self.buy
+        sell_le = np.cumsum(self.sell)
+        sell_lt = sell_le - self.sell
+
+        # Bounds of the excess of supply at any price in each bin
+        nonempty = (self.buy > 0) | (self.sell > 0)
+        lows = np.flatnonzero(nonempty & (sell_le >= buy_gt))
+        highs = np.flatnonzero(nonempty & (sell_lt >= buy_ge))
+        j_lo = lows[0]
+        j_hi = highs[0] if highs.shape[0] > 0 else \
+            np.flatnonzero(nonempty)[-1]
+
+        p_lo, p_hi = self.edges[j_lo], self.edges[j_hi + 1]
+        q_lo = min(buy_gt[j_hi], sell_lt[j_lo])
+        q_hi = min(buy_ge[j_lo], sell_le[j_hi])
+        return OrderedDict([
+            ('price', (p_lo + p_hi) / 2), ('quantity', (q_lo + q_hi) / 2),
+            ('price_error', (p_hi - p_lo) / 2),
+            ('quantity_error', (q_hi - q_lo) / 2)])
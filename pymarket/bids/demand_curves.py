@@ -1,9 +1,11 @@
 import numpy as np
 import pandas as pd
 from pymarket.bids import BidManager
+from pymarket.utils.cache import LRUCache
+from pymarket.utils.columns import bid_positions
 
 
-def demand_curve_from_bids(bids):
+def demand_curve_from_bids(bids, order=None):
     """
     Creates a demand curve from a set of buying bids.
     It is the inverse cumulative distribution of quantity
@@ -14,6 +16,10 @@ def demand_curve_from_bids(bids):
     bids
         Collection of all the bids in the market. The algorithm
         filters only the buying bids.
+    order : np.ndarray or None
+        Identifiers of the buying bids already sorted by decreasing
+        price, as given by `BidManager.sorted_index`. If given, the
+        bids are not sorted again.
 
     Returns
     ---------
@@ -67,8 +73,11 @@ def demand_curve_from_bids(bids):
     array([0, 2, 3])
 
     """
-    buying = bids[bids.buying]
-    buying = buying.sort_values('price', ascending=False)
+    if order is None:
+        buying = bids[bids.buying]
+        buying = buying.sort_values('price', ascending=False)
+    else:
+        buying = bids.loc[order]
     buying['acum'] = buying.quantity.cumsum()
     demand_curve = buying[['acum', 'price']].values
     demand_curve = np.vstack([demand_curve, [np.inf, 0]])
@@ -76,7 +85,7 @@ def demand_curve_from_bids(bids):
     return demand_curve, index
 
 
-def supply_curve_from_bids(bids):
+def supply_curve_from_bids(bids, order=None):
     """
     Creates a supply curve from a set of selling bids.
     It is the cumulative distribution of quantity
@@ -87,6 +96,10 @@ def supply_curve_from_bids(bids):
     bids: pd.DataFrame
         Collection of all the bids in the market. The algorithm
         filters only the selling bids.
+    order : np.ndarray or None
+        Identifiers of the selling bids already sorted by increasing
+        price, as given by `BidManager.sorted_index`. If given, the
+        bids are not sorted again.
 
     Returns
     ---------
@@ -141,8 +154,11 @@ def supply_curve_from_bids(bids):
 
 
     """
-    selling = bids[bids.buying == False]
-    selling = selling.sort_values('price')
+    if order is None:
+        selling = bids[bids.buying == False]
+        selling = selling.sort_values('price')
+    else:
+        selling = bids.loc[order]
     selling['acum'] = selling.quantity.cumsum()
     supply_curve = selling[['acum', 'price']].values
     supply_curve = np.vstack([supply_curve, [np.inf, np.inf]])
@@ -150,6 +166,142 @@ def supply_curve_from_bids(bids):
     return supply_curve, index
 
 
+def manager_curve(bm, buying=True):
+    """Demand or supply curve of the active bids of a BidManager,
+    built from its arrays and its sorted index of the side.
+
+    Parameters
+    ----------
+    bm : BidManager
+        Manager with the bids.
+    buying : bool
+        Builds the demand curve if `True` and the
+        supply curve otherwise.
+
+    Returns
+    -------
+    curve : np.ndarray
+        Curve in the format of `demand_curve_from_bids`
+        or `supply_curve_from_bids`.
+    index : np.ndarray
+        Identifiers of the bids in the curve.
+
+    Examples
+    ---------
+    >>> bm = pm.BidManager()
+    >>> bm.add_bids([1, 2, 1], [3, 1, 4], [0, 1, 2], [True, False, True])
+    range(0, 3)
+    >>> curve, index = manager_curve(bm, buying=True)
+    >>> curve
+    array([[ 1.,  4.],
+           [ 2.,  3.],
+           [inf,  0.]])
+    >>> index
+    array([2, 0])
+    """
+    index = bm.sorted_index(buying)
+    arrays = bm.get_arrays()
+    position = bid_positions(arrays['bid'], index)
+    curve = np.empty((index.shape[0] + 1, 2))
+    curve[:-1, 0] = np.cumsum(arrays['quantity'][position])
+    curve[:-1, 1] = arrays['price'][position]
+    curve[-1] = [np.inf, 0 if buying else np.inf]
+    return curve, index.astype('int64')
+
+
+class CurveCache(object):
+    """Least recently used cache of the demand and supply
+    curves of BidManagers.
+
+    Curves are stored with the `cache_key` of the manager, which
+    changes each time its bids change, so replotting or reclearing
+    a book that has not changed reuses its curves without hashing
+    nor sorting the bids. The arrays returned are shared between
+    all the users of the cache and can not be modified.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of curves to keep.
+
+    Attributes
+    -----------
+    hits : int
+        Number of curves found in the cache.
+    misses : int
+        Number of curves that had to be built.
+
+    Examples
+    ---------
+    >>> bm = pm.BidManager()
+    >>> bm.add_bids([1, 2], [3, 1], [0, 1], [True, False])
+    range(0, 2)
+    >>> cache = CurveCache(maxsize=4)
+    >>> dc, index = cache.get(bm, buying=True)
+    >>> dc
+    array([[ 1.,  3.],
+           [inf,  0.]])
+    >>> dc, index = cache.get(bm, buying=True)
+    >>> cache.hits, cache.misses
+    (1, 1)
+    """
+
+    def __init__(self, maxsize=32):
+        self._curves = LRUCache(maxsize)
+
+    def __len__(self):
+        return len(self._curves)
+
+    @property
+    def maxsize(self):
+        """Maximum number of curves to keep"""
+        return self._curves.maxsize
+
+    @property
+    def hits(self):
+        return self._curves.hits
+
+    @property
+    def misses(self):
+        return self._curves.misses
+
+    def get(self, bm, buying=True):
+        """Demand or supply curve of the bids of a BidManager
+
+        Parameters
+        ----------
+        bm : BidManager
+            Manager with the bids.
+        buying : bool
+            Returns the demand curve if `True` and
+            the supply curve otherwise.
+
+        Returns
+        -------
+        curve : np.ndarray
+            Read only curve, as returned by `manager_curve`.
+        index : np.ndarray
+            Read only order of the bids in the curve.
+        """
+        key = (bm.cache_key, bool(buying))
+        cached = self._curves.get(key)
+        if cached is not None:
+            return cached
+
+        curve, index = manager_curve(bm, buying)
+        curve.flags.writeable = False
+        index.flags.writeable = False
+        self._curves.put(key, (curve, index))
+        return curve, index
+
+    def clear(self):
+        """Removes all the curves and resets the counters"""
+        self._curves.clear()
+
+
+curve_cache = CurveCache()
+
+
 def get_value_stepwise(x, f):
     """
     Returns the value of a stepwise constant
@@ -196,6 +348,107 @@ def get_value_stepwise(x, f):
             return step[1]
 
 
+def get_values_stepwise(xs, f):
+    """
+    Vectorized version of `get_value_stepwise` that
+    evaluates a stepwise constant function in many
+    points at once.
+
+    Parameters
+    ----------
+    xs: np.ndarray
+        Values in which the function is to be
+        evaluated
+    f: np.ndarray
+        Stepwise function represented as a 2 column
+        matrix. Each row is the rightmost extreme
+        point of each constant interval. The first column
+        contains the x coordinate and is sorted increasingly.
+
+    Returns
+    --------
+    np.ndarray
+        The image of each value of `xs` under f as floats.
+        Values that are negative or greater than `f[-1, 0]`
+        are mapped to NaN.
+
+    Examples
+    ---------
+    >>> f = np.array([
+    ...     [1, 1],
+    ...     [3, 4]])
+    >>> pm.get_values_stepwise([-1, 0, 0.5, 1, 2, 3, 4], f)
+    array([nan,  1.,  1.,  1.,  4.,  4., nan])
+
+    """
+    xs = np.asarray(xs, dtype='float64')
+    idx = np.searchsorted(f[:, 0], xs, side='left')
+    valid = (xs >= 0) & (idx < f.shape[0])
+    values = np.full(xs.shape, np.nan)
+    values[valid] = f[idx[valid], 1]
+    return values
+
+
+def get_quantities_stepwise(ps, f, increasing=None):
+    """
+    Inverse of `get_values_stepwise` for demand and supply
+    curves: finds the total quantity traded at each price.
+
+    For a demand curve (non-increasing prices) it is the
+    quantity of all the bids with a price greater or equal
+    than the given one, and for a supply curve (non-decreasing
+    prices) the quantity of all the bids with a price smaller
+    or equal than it. The points with x coordinate at infinity,
+    used to represent the end of the curves, are ignored.
+
+    Parameters
+    ----------
+    ps: np.ndarray
+        Prices in which the inverse is to be evaluated
+    f: np.ndarray
+        Stepwise function represented as a 2 column
+        matrix, as returned by `demand_curve_from_bids`
+        or `supply_curve_from_bids`.
+    increasing: bool or None
+        `True` if `f` is a supply curve and `False` if it is
+        a demand curve. If None, it is `True` only if the last
+        price of `f` is greater than the first one.
+
+    Returns
+    --------
+    np.ndarray
+        Quantity traded at each price of `ps`. NaN
+        prices are mapped to NaN.
+
+    Examples
+    ---------
+    >>> bm = pm.BidManager()
+    >>> bm.add_bids([1, 3, 2.3], [1, 0.5, 0.1], [0, 1, 2])
+    range(0, 3)
+    >>> dc, _ = pm.demand_curve_from_bids(bm.get_df())
+    >>> pm.get_quantities_stepwise([0, 0.1, 0.7, 2], dc)
+    array([6.3, 6.3, 1. , 0. ])
+    >>> bm = pm.BidManager()
+    >>> bm.add_bids([1, 3, 2.3], [1, 0.5, 0.1], [0, 1, 2], False)
+    range(0, 3)
+    >>> sc, _ = pm.supply_curve_from_bids(bm.get_df())
+    >>> pm.get_quantities_stepwise([0, 0.1, 0.7, 2], sc)
+    array([0. , 2.3, 5.3, 6.3])
+
+    """
+    ps = np.asarray(ps, dtype='float64')
+    if increasing is None:
+        increasing = f[-1, 1] > f[0, 1]
+    steps = f[np.isfinite(f[:, 0])]
+    if increasing:
+        counts = np.searchsorted(steps[:, 1], ps, side='right')
+    else:
+        counts = np.searchsorted(-steps[:, 1], -ps, side='right')
+    quantities = np.concatenate([[0], steps[:, 0]])[counts].astype('float64')
+    quantities[np.isnan(ps)] = np.nan
+    return quantities
+
+
 def intersect_stepwise(
         f,
         g,
@@ -208,6 +461,10 @@ def intersect_stepwise(
     than g.
     If no intersection is found, None is returned.
 
+    Both functions are evaluated at the union of their
+    breakpoints with a binary search, so the cost is
+    :math:`O(N \\log N)` in the number of steps.
+
     Parameters
     ----------
     f: np.ndarray
@@ -271,19 +528,21 @@ def intersect_stepwise(
     (None, None, None, 2.25)
     """
     x_max = np.min([f.max(axis=0)[0], g.max(axis=0)[0]])
-    xs = sorted([x for x in set(g[:, 0]).union(set(f[:, 0])) if x <= x_max])
-    fext = [get_value_stepwise(x, f) for x in xs]
-    gext = [get_value_stepwise(x, g) for x in xs]
-    x_ast = None
-    for i in range(len(xs) - 1):
-        if (fext[i] > gext[i]) and (fext[i + 1] < gext[i + 1]):
-            x_ast = xs[i]
+    # Both columns are sorted, so a stable sort only merges two runs
+    xs = np.sort(np.concatenate([f[:, 0], g[:, 0]]), kind='stable')
+    xs = xs[np.append(True, xs[1:] != xs[:-1]) & (xs <= x_max)]
+    # Both curves are evaluated in all the breakpoints at once:
+    # the value in x is the one of the first step ending at or after x.
+    fext = f[np.searchsorted(f[:, 0], xs, side='left'), 1]
+    gext = g[np.searchsorted(g[:, 0], xs, side='left'), 1]
+    crossings = np.flatnonzero((fext[:-1] > gext[:-1]) & (fext[1:] < gext[1:]))
+    x_ast = xs[crossings[-1]] if crossings.shape[0] > 0 else None
 
     f_ast = np.argmax(f[:, 0] >= x_ast) if x_ast is not None else None
     g_ast = np.argmax(g[:, 0] >= x_ast) if x_ast is not None else None
 
-    g_val = g[g_ast, 1] if g_ast is not None else get_value_stepwise(xs[-1], g)
-    f_val = f[f_ast, 1] if f_ast is not None else get_value_stepwise(xs[-1], f)
+    g_val = g[g_ast, 1] if g_ast is not None else gext[-1]
+    f_val = f[f_ast, 1] if f_ast is not None else fext[-1]
 
     intersect_domain_both = x_ast in f[:, 0] and x_ast in g[:, 0]
     if not (intersect_domain_both) and (x_ast is not None):
@@ -292,3 +551,150 @@ def intersect_stepwise(
         v = g_val * k + (1 - k) * f_val
 
     return x_ast, f_ast, g_ast, v
+
+
+def pack_curves(curves):
+    """
+    Packs a list of stepwise curves into a single
+    ragged array.
+
+    Parameters
+    ----------
+    curves: list of np.ndarray
+        Stepwise curves, each one represented as a 2 column
+        matrix as in `intersect_stepwise`.
+
+    Returns
+    --------
+    values: np.ndarray
+        All the curves stacked in a single (M, 2) matrix.
+    offsets: np.ndarray
+        Curve `i` is `values[offsets[i]: offsets[i + 1]]`.
+
+    Examples
+    ---------
+    >>> values, offsets = pm.pack_curves([np.array([[1, 3], [3, 1]]),
+    ...                                   np.array([[2, 2]])])
+    >>> offsets
+    array([0, 2, 3])
+    """
+    lengths = [c.shape[0] for c in curves]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype('int64')
+    values = np.vstack(curves).astype('float64')
+    return values, offsets
+
+
+def intersect_stepwise_batch(f, f_offsets, g, g_offsets, k=0.5):
+    """
+    Intersects many pairs of stepwise constant functions
+    at once. The pair `i` is made of
+    `f[f_offsets[i]: f_offsets[i + 1]]` and
+    `g[g_offsets[i]: g_offsets[i + 1]]`, and the result for each pair
+    is the same as the one of `intersect_stepwise`.
+
+    All the breakpoints are ranked together, so that the pair and
+    the x coordinate of each breakpoint can be combined in a single
+    integer key that is increasing inside each curve and between
+    consecutive curves. A single `np.searchsorted` over these keys
+    evaluates all the curves in all their breakpoints.
+
+    Parameters
+    ----------
+    f: np.ndarray
+        Packed non-increasing stepwise functions, see `pack_curves`.
+    f_offsets: np.ndarray
+        Offsets of each function in `f`.
+    g: np.ndarray
+        Packed non-decreasing stepwise functions, see `pack_curves`.
+    g_offsets: np.ndarray
+        Offsets of each function in `g`.
+    k : float
+        Weight of the value of `g` when the intersection is
+        empty or an interval, as in `intersect_stepwise`.
+
+    Returns
+    --------
+    x_ast : np.ndarray
+        Abscissa of each intersection, NaN if it is empty.
+    f_ast : np.ndarray
+        Index of the interval of each `f` in the intersection,
+        relative to the start of the function, -1 if it is empty.
+    g_ast : np.ndarray
+        Index of the interval of each `g` in the intersection,
+        relative to the start of the function, -1 if it is empty.
+    v : np.ndarray
+        Ordinate of each intersection as in `intersect_stepwise`.
+
+    Examples
+    ---------
+    >>> fs = [np.array([[1, 3], [3, 1]]), np.array([[1, 3], [2, 2.5]])]
+    >>> gs = [np.array([[2, 2]]), np.array([[1, 1], [2, 2]])]
+    >>> f, f_offsets = pm.pack_curves(fs)
+    >>> g, g_offsets = pm.pack_curves(gs)
+    >>> x, f_ast, g_ast, v = pm.intersect_stepwise_batch(f, f_offsets, g, g_offsets)
+    >>> x
+    array([ 1., nan])
+    >>> f_ast, g_ast
+    (array([ 0, -1]), array([ 0, -1]))
+    >>> v
+    array([2.  , 2.25])
+    """
+    f_offsets = np.asarray(f_offsets, dtype='int64')
+    g_offsets = np.asarray(g_offsets, dtype='int64')
+    n_pairs = f_offsets.shape[0] - 1
+    f_pair = np.repeat(np.arange(n_pairs), np.diff(f_offsets))
+    g_pair = np.repeat(np.arange(n_pairs), np.diff(g_offsets))
+
+    # Integer keys ordered by pair first and then by abscissa
+    uniques, ranks = np.unique(
+        np.concatenate([f[:, 0], g[:, 0]]), return_inverse=True)
+    n_ranks = uniques.shape[0]
+    f_keys = f_pair * n_ranks + ranks[: f.shape[0]]
+    g_keys = g_pair * n_ranks + ranks[f.shape[0]:]
+
+    # Union of the breakpoints of each pair, up to the smallest maximum
+    x_max = np.minimum(np.maximum.reduceat(f[:, 0], f_offsets[:-1]),
+                       np.maximum.reduceat(g[:, 0], g_offsets[:-1]))
+    keys = np.union1d(f_keys, g_keys)
+    pair = keys // n_ranks
+    xs = uniques[keys % n_ranks]
+    inside = xs <= x_max[pair]
+    keys, pair, xs = keys[inside], pair[inside], xs[inside]
+
+    fext = f[np.searchsorted(f_keys, keys, side='left'), 1]
+    gext = g[np.searchsorted(g_keys, keys, side='left'), 1]
+
+    # Last crossing of each pair
+    same = pair[:-1] == pair[1:]
+    crossing = np.flatnonzero(
+        same & (fext[:-1] > gext[:-1]) & (fext[1:] < gext[1:]))
+    last = np.full(n_pairs, -1, dtype='int64')
+    np.maximum.at(last, pair[crossing], crossing)
+    found = last >= 0
+
+    x_ast = np.full(n_pairs, np.nan)
+    x_ast[found] = xs[last[found]]
+    f_ast = np.full(n_pairs, -1, dtype='int64')
+    g_ast = np.full(n_pairs, -1, dtype='int64')
+    cross_keys = keys[last[found]]
+    f_ast[found] = np.searchsorted(f_keys, cross_keys, side='left')
+    g_ast[found] = np.searchsorted(g_keys, cross_keys, side='left')
+
+    # Values in the intersection or in the last common breakpoint
+    end = np.flatnonzero(np.append(~same, True))
+    f_val = fext[end]
+    g_val = gext[end]
+    f_val[found] = f[f_ast[found], 1]
+    g_val[found] = g[g_ast[found], 1]
+    in_f = np.zeros(n_pairs, dtype=bool)
+    in_g = np.zeros(n_pairs, dtype=bool)
+    in_f[found] = f[f_ast[found], 0] == x_ast[found]
+    in_g[found] = g[g_ast[found], 0] == x_ast[found]
+
+    v = g_val * k + (1 - k) * f_val
+    only_one = found & ~(in_f & in_g)
+    v[only_one] = np.where(in_f, g_val, f_val)[only_one]
+
+    f_ast[found] -= f_offsets[:-1][found]
+    g_ast[found] -= g_offsets[:-1][found]
+    return x_ast, f_ast, g_ast, v
@@ -6,6 +6,7 @@ mechanisms can use them
 import numpy as np
 import pandas as pd
 from pymarket.bids import BidManager
+from pymarket.utils.columns import bid_arrays, bid_positions
 from collections import OrderedDict
 
 
@@ -37,8 +38,16 @@ def new_player_id(index):
     >>> id_gen([2, 4])
     7
 
+    Each generator keeps its own counter, so generators
+    created by different calls (or threads) do not interfere:
+
+    >>> other_gen = new_player_id(6)
+    >>> other_gen([0, 1])
+    6
+    >>> id_gen([0, 1])
+    8
+
     """
-    new_player_id.index = index
     def new_id(users):
         """
         Generates a unique identifier for a
@@ -64,10 +73,10 @@ def new_player_id(index):
 
         """
 
-        #nonlocal index
+        nonlocal index
         if len(users) > 1:
-            new_index = new_player_id.index
-            new_player_id.index += 1
+            new_index = index
+            index += 1
         else:
             new_index = users[0]
 
@@ -76,6 +85,126 @@ def new_player_id(index):
     return new_id
 
 
+def _reverse_groups(positions, price):
+    """Helper for merge_same_price_arrays. Reverses the groups of
+    bids with the same price of a side sorted by decreasing price,
+    keeping the order of the bids inside each group."""
+    n = positions.shape[0]
+    if n == 0:
+        return positions
+    new_group = np.ones(n, dtype=bool)
+    new_group[1:] = price[positions[1:]] != price[positions[:-1]]
+    group = np.cumsum(new_group) - 1
+    sizes = np.bincount(group)
+    first = np.cumsum(sizes) - sizes
+    reversed_first = np.cumsum(sizes[::-1]) - sizes[::-1]
+    target = reversed_first[group[-1] - group] + \
+        np.arange(n) - first[group]
+    result = np.empty_like(positions)
+    result[target] = positions
+    return result
+
+
+def merge_same_price_arrays(df, prec=5, order=None):
+    """
+    Array version of `merge_same_price`. Merges in each side
+    (buying or selling) all players with the same price, rounded
+    to `prec` digits, without building intermediate dataframes.
+
+    Buying bids come first, followed by the selling bids, and
+    in each side the merged bids are sorted by increasing price.
+    A merged bid made of a single bid keeps its user, while the
+    merged bids made of several bids are assigned consecutive new
+    users, starting after the largest existing one. The time and
+    divisibility of a merged bid are the ones of its first bid.
+
+    Parameters
+    ----------
+    df : pd.DataFrame or OrderedDict
+        Collection of bids to process, as a dataframe
+        or as the arrays of `BidManager.get_arrays`
+    prec: float
+        Number of digits to use after the comma
+        while comparing floating point prices
+        as equal.
+    order: tuple or None
+        Identifiers of the buying and of the selling bids sorted
+        by price, as given by `BidManager.sorted_index`. If given,
+        the bids are not sorted again. Bids whose prices only become
+        equal after rounding are then kept in the order of price
+        instead of the order in which they were added.
+
+    Returns
+    -------
+    columns : OrderedDict
+        Maping from each column of `df` to the array
+        with the values of the merged bids.
+    offsets : np.ndarray
+        The original bids of the merged bid `i` are
+        `bid_ids[offsets[i]: offsets[i + 1]]`.
+    bid_ids : np.ndarray
+        Index of the original bids, grouped by merged bid.
+
+    Examples
+    ---------
+    >>> bm = BidManager()
+    >>> bm.add_bids([0.3, 0.7, 2], [1, 1, 1], [0, 1, 2], [True, True, False])
+    range(0, 3)
+    >>> columns, offsets, bid_ids = merge_same_price_arrays(bm.get_df())
+    >>> columns['quantity']
+    array([1., 2.])
+    >>> columns['user']
+    array([3, 2])
+    >>> offsets
+    array([0, 2, 3])
+    >>> bid_ids
+    array([0, 1, 2])
+    >>> order = bm.sorted_index(True), bm.sorted_index(False)
+    >>> merge_same_price_arrays(bm.get_df(), order=order)[2]
+    array([0, 1, 2])
+    """
+    values, index = bid_arrays(df)
+    price = np.round(np.asarray(values['price'], dtype='float64'), prec)
+    buying = np.asarray(values['buying'], dtype=bool)
+
+    # Buyers first, then sellers, each side by increasing price.
+    # The sort is stable so bids with the same price keep their order.
+    if order is None:
+        order = np.lexsort((price, ~buying))
+    else:
+        buyers = _reverse_groups(bid_positions(index, order[0]), price)
+        order = np.concatenate([buyers, bid_positions(index, order[1])])
+    price = price[order]
+    buying_sorted = buying[order]
+    new_group = np.ones(order.shape[0], dtype=bool)
+    new_group[1:] = (price[1:] != price[:-1]) | \
+        (buying_sorted[1:] != buying_sorted[:-1])
+    starts = np.flatnonzero(new_group)
+    offsets = np.append(starts, order.shape[0]).astype('int64')
+    lengths = np.diff(offsets)
+    first = order[starts]
+
+    columns = OrderedDict()
+    for name, column in values.items():
+        column = np.asarray(column)
+        if name == 'quantity':
+            columns[name] = np.add.reduceat(column[order], starts) \
+                if starts.shape[0] > 0 else column[:0]
+        elif name == 'price':
+            columns[name] = price[starts]
+        else:
+            columns[name] = column[first]
+
+    user = columns['user'].copy()
+    merged = lengths > 1
+    if merged.any():
+        next_user = np.asarray(values['user']).max() + 1
+        user[merged] = next_user + np.arange(np.count_nonzero(merged))
+    columns['user'] = user
+
+    return columns, offsets, index[order]
+
+
 def merge_same_price(df, prec=5):
     """
     Process a collection of bids by merging in each
@@ -122,7 +251,7 @@ def merge_same_price(df, prec=5):
     2       2.0  1.000000     2   False     0       True
     3       1.0  2.444446     3   False     0       True
     4       3.0  2.444447     4   False     0       True
-    >>> bids, index = pm.merge_same_price(bm.get_df(), 5)
+    >>> bids, index = pm.bids.merge_same_price(bm.get_df(), 5)
     >>> bids
        quantity    price  user  buying  time  divisible
     0       1.0  1.00000     5    True     0       True
@@ -188,7 +317,7 @@ def merge_same_price(df, prec=5):
     25
     >>> mar.accept_bid(50,  200, 10, False) # SafePeak
     26
-    >>> bids, index = pm.merge_same_price(mar.bm.get_df())
+    >>> bids, index = pm.bids.merge_same_price(mar.bm.get_df())
     >>> mar.bm.get_df()
         quantity  price  user  buying  time  divisible
     0        250  200.0     0    True     0       True
@@ -223,48 +352,10 @@ def merge_same_price(df, prec=5):
 
     """
 
-    id_gen = new_player_id(df.user.max() + 1)
-    columns = df.columns.copy()
-
-    df = df.copy().reset_index().rename(columns={'index': 'bid'})
-
-    buy = df.loc[df['buying'], :]
-    sell = df.loc[~df['buying'], :]
-
-    dataframes = [buy, sell]
-
-    agg_fun = {
-        'bid': list,
-        'user': list,
-        'quantity': sum,
-        'buying': lambda x: x.sample(1),
-        'time': lambda x: x.sample(1),
-        'divisible': lambda x: x.sample(1),
-    }
-
-    dataframe_new = []
-    user_to_bid = OrderedDict()
-    for df_ in dataframes:
-        rounded_prices = df_.price.apply(lambda x: np.round(x, prec))
-        df_new = df_.groupby(rounded_prices).agg(agg_fun).reset_index()
-        # print(df_new)
-        df_new.user = df_new.user.apply(id_gen)
-        #maping = df_new.set_index('user').bid.to_dict()
-        # for k, v in maping.items():
-        #    user_to_bid[k] = v
-
-        dataframe_new.append(df_new)
-
-    dataframe_new = pd.concat(dataframe_new).reset_index(drop=True)
-    final_maping = dataframe_new.bid.to_dict()
-    # print(final_maping)
-    dataframe_new = dataframe_new[columns]
-    # print('-------------')
-    # print(dataframe_new)
-    #index_to_user = dataframe_new.user.to_dict()
-
-    #final_maping =
-    # for k, v in index_to_user.items():
-    #    final_maping[k] = user_to_bid[v]
+    columns, offsets, bid_ids = merge_same_price_arrays(df, prec)
+    dataframe_new = pd.DataFrame(columns, columns=df.columns)
+    final_maping = {
+        i: bid_ids[offsets[i]: offsets[i + 1]].tolist()
+        for i in range(offsets.shape[0] - 1)}
 
     return dataframe_new, final_maping
@@ -0,0 +1,226 @@
+"""
+Compact representation of demand and supply curves that
+can be shared by mechanisms and plots.
+"""
+import numpy as np
+from pymarket.bids.demand_curves import demand_curve_from_bids, \
+    supply_curve_from_bids, intersect_stepwise, manager_curve, curve_cache
+
+
+class StepCurve(object):
+    """Stepwise constant demand or supply curve.
+
+    The curve is stored as two contiguous arrays with the
+    cumulative quantity and the price of each bid, sorted
+    by decreasing price for demand curves and by increasing
+    price for supply curves, together with the identifier of
+    the bid in each step.
+
+    Parameters
+    ----------
+    quantity : np.ndarray
+        Cumulative quantity at the end of each step.
+    price : np.ndarray
+        Price of each step.
+    index : np.ndarray
+        Identifier of the bid of each step.
+    buying : bool
+        `True` for demand curves and `False` for supply curves.
+
+    Examples
+    ---------
+    >>> bm = pm.BidManager()
+    >>> bm.add_bids([1, 3, 2.3], [1, 0.5, 0.1], [0, 1, 2])
+    range(0, 3)
+    >>> bm.add_bids([2, 2], [0.2, 0.8], [3, 4], False)
+    range(3, 5)
+    >>> demand = pm.bids.StepCurve.from_bids(bm.get_df(), buying=True)
+    >>> supply = pm.bids.StepCurve.from_bids(bm.get_df(), buying=False)
+    >>> demand.quantity
+    array([1. , 4. , 6.3])
+    >>> demand.index
+    array([0, 1, 2])
+    >>> demand.price_at([0.5, 5, 7])
+    array([1. , 0.1, 0. ])
+    >>> supply.quantity_at([0.5, 1])
+    array([2., 4.])
+    >>> demand.intersect(supply)
+    (2.0, 1, 0, 0.5)
+    >>> demand.surplus(0.5)
+    0.5
+    """
+
+    __slots__ = ('quantity', 'price', 'index', 'buying', '_array')
+
+    def __init__(self, quantity, price, index, buying):
+        self.quantity = np.ascontiguousarray(quantity, dtype='float64')
+        self.price = np.ascontiguousarray(price, dtype='float64')
+        self.index = np.ascontiguousarray(index, dtype='int64')
+        self.buying = bool(buying)
+        self._array = None
+
+    @classmethod
+    def from_bids(cls, bids, buying=True, order=None):
+        """Builds the demand or supply curve of a collection of bids
+
+        Parameters
+        ----------
+        bids : pd.DataFrame
+            Collection of all the bids in the market.
+        buying : bool
+            Builds the demand curve if `True` and the
+            supply curve otherwise.
+        order : np.ndarray or None
+            Identifiers of the bids of the side already sorted,
+            as given by `BidManager.sorted_index`.
+
+        Returns
+        -------
+        StepCurve
+            The curve of the requested side.
+        """
+        if buying:
+            curve, index = demand_curve_from_bids(bids, order)
+        else:
+            curve, index = supply_curve_from_bids(bids, order)
+        obj = cls(curve[:-1, 0], curve[:-1, 1], index, buying)
+        obj._array = curve
+        return obj
+
+    @classmethod
+    def from_manager(cls, bm, buying=True, cache=curve_cache):
+        """Builds the demand or supply curve of the bids of
+        a BidManager, reusing the curves of `cache` if the
+        bids did not change since they were built.
+
+        Parameters
+        ----------
+        bm : BidManager
+            Manager with the bids.
+        buying : bool
+            Builds the demand curve if `True` and the
+            supply curve otherwise.
+        cache : CurveCache or None
+            Cache with the curves of the managers. If
+            None, the curve is always built.
+
+        Returns
+        -------
+        StepCurve
+            The curve of the requested side.
+        """
+        if cache is not None:
+            curve, index = cache.get(bm, buying)
+        else:
+            curve, index = manager_curve(bm, buying)
+        obj = cls(curve[:-1, 0], curve[:-1, 1], index, buying)
+        obj._array = curve
+        return obj
+
+    def __len__(self):
+        return self.quantity.shape[0]
+
+    @property
+    def end_price(self):
+        """Price after the last step: 0 for demand
+        curves and infinity for supply curves."""
+        return 0. if self.buying else np.inf
+
+    def to_array(self):
+        """Curve in the format of `demand_curve_from_bids`
+
+        Returns
+        -------
+        np.ndarray
+            (N + 1, 2) matrix with the cumulative quantity and
+            the price of each step, plus an extra point at infinity.
+        """
+        if self._array is None:
+            array = np.empty((len(self) + 1, 2))
+            array[:-1, 0] = self.quantity
+            array[:-1, 1] = self.price
+            array[-1] = [np.inf, self.end_price]
+            self._array = array
+        return self._array
+
+    def price_at(self, quantities):
+        """Price of the curve at each quantity
+
+        Parameters
+        ----------
+        quantities : np.ndarray
+            Quantities in which the curve is evaluated.
+
+        Returns
+        -------
+        np.ndarray
+            Price at each quantity. Quantities after the last step
+            get the end price of the curve and negative ones NaN.
+        """
+        quantities = np.asarray(quantities, dtype='float64')
+        idx = np.searchsorted(self.quantity, quantities, side='left')
+        prices = np.append(self.price, self.end_price)[idx]
+        prices[quantities < 0] = np.nan
+        return prices
+
+    def quantity_at(self, prices):
+        """Total quantity traded at each price
+
+        Parameters
+        ----------
+        prices : np.ndarray
+            Prices in which the inverse of the curve is evaluated.
+
+        Returns
+        -------
+        np.ndarray
+            For demand curves, the quantity of the bids with a price
+            greater or equal than each price; for supply curves, the
+            quantity of the bids with a price smaller or equal.
+        """
+        prices = np.asarray(prices, dtype='float64')
+        if self.buying:
+            counts = np.searchsorted(-self.price, -prices, side='right')
+        else:
+            counts = np.searchsorted(self.price, prices, side='right')
+        quantities = np.concatenate([[0], self.quantity])[counts]
+        quantities[np.isnan(prices)] = np.nan
+        return quantities
+
+    def intersect(self, other, k=0.5):
+        """Intersection of a demand curve with a supply curve
+
+        Parameters
+        ----------
+        other : StepCurve
+            Supply curve to intersect with.
+        k : float
+            Weight of the price of `other` when the
+            intersection is not uniquely defined.
+
+        Returns
+        -------
+        tuple
+            `(x_ast, f_ast, g_ast, v)` as described
+            in `intersect_stepwise`.
+        """
+        return intersect_stepwise(self.to_array(), other.to_array(), k)
+
+    def surplus(self, price=0):
+        """Area between the curve and a price
+
+        Parameters
+        ----------
+        price : float
+            Reference price.
+
+        Returns
+        -------
+        float
+            For demand curves, the total surplus of the buyers
+            paying `price`; for supply curves, the total surplus
+            of the sellers receiving it.
+        """
+        step = np.diff(self.quantity, prepend=0)
+        gain = self.price - price if self.buying else price - self.price
+        return float((step * np.clip(gain, 0, None)).sum())
@@ -1,4 +1,4 @@
-from pymarket.bids import BidManager
+from pymarket.bids import BidManager, StepCurve
 from pymarket.mechanisms import *
 from pymarket.transactions import TransactionManager
 from pymarket.statistics import *
@@ -26,6 +26,12 @@ class Market():
 
     Parameters
     ----------
+    path: str or None
+        Directory where the bids are stored in files, see
+        `BidManager`. If None, the bids are kept in memory.
+
+    Attributes
+    -----------
     bm: BidManager
         All bids are stored in the bid manager
     transactions: TransactionManager
@@ -93,12 +99,23 @@ class Market():
 
     """
 
-    def __init__(self):
+    def __init__(self, path=None):
         """TODO: to be defined1."""
-        self.bm = BidManager()
+        self.bm = BidManager(path)
         self.transactions = TransactionManager()
         self.extra = OrderedDict()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Releases the files where the bids are
+        stored, if any. See `BidManager.close`."""
+        self.bm.close()
+
     def accept_bid(self, *args):
         """Adds a bid to the bid manager
 
@@ -117,10 +134,43 @@ class Market():
         bid_id = self.bm.add_bid(*args)
         return bid_id
 
+    def accept_bids(self, *args, **kwargs):
+        """Adds a collection of bids to the bid manager at once
+
+        Parameters
+        ----------
+        *args :
+            Collection of bids as arrays, a dataframe or a list of
+            tuples. See `BidManager.add_bids` documentation.
+
+        **kwargs :
+            Keyworded parameters of `BidManager.add_bids`.
+
+        Returns
+        -------
+        bid_ids: range
+            The ids of the new created bids in the BidManager
+
+        Examples
+        ---------
+        >>> mar = pm.Market()
+        >>> r = np.random.RandomState(420)
+        >>> mar.accept_bids(pm.datasets.generate(2, 3, r=r))
+        range(0, 5)
+        """
+        bid_ids = self.bm.add_bids(*args, **kwargs)
+        return bid_ids
+
     def run(self, algo, *args, **kwargs):
         """Runs a given mechanism with the current
         bids
 
+        Mechanisms that accept arrays (Huang and MUDA) get the
+        bids from `BidManager.get_arrays`, so no dataframe is
+        built and bids stored in files are read from the maps,
+        together with the sorted index of each side maintained
+        by the `BidManager`, so the bids are not sorted again.
+
         Parameters
         ----------
         algo : str
@@ -147,8 +197,14 @@ class Market():
 
         
         """
-        df = self.bm.get_df()
-        mec = MECHANISM[algo](df, *args, **kwargs)
+        mechanism = MECHANISM[algo]
+        if mechanism.accepts_arrays:
+            bids = self.bm.get_arrays()
+            kwargs.setdefault('order', (
+                self.bm.sorted_index(True), self.bm.sorted_index(False)))
+        else:
+            bids = self.bm.get_df()
+        mec = mechanism(bids, *args, **kwargs)
         transactions, extra = mec.run()
         self.transactions = transactions
         self.extra = extra
@@ -182,20 +238,25 @@ class Market():
         if 'fees' in self.extra:
             extras['fees'] = self.extra['fees']
         extras['reservation_prices'] = reservation_prices
+        bids = self.bm.get_df()
+        transactions = self.transactions.get_df()
         for stat in STATS:
             if stat not in exclude:
                 stats[stat] = STATS[stat](
-                    self.bm.get_df(),
-                    self.transactions.get_df(),
+                    bids,
+                    transactions,
                     **extras
                 )
         self.stats = stats
         return stats
 
     def plot(self):
-        """Plots both demand curves"""
-        df = self.bm.get_df()
-        plot_demand_curves(df)
+        """Plots both demand curves. The curves are kept in
+        `curve_cache` until the bids change."""
+        curves = tuple(
+            StepCurve.from_manager(self.bm, buying)
+            for buying in [True, False])
+        plot_demand_curves(self.bm.get_df(), curves=curves)
 
     def plot_method(self, method, ax=None):
         """
@@ -1,7 +1,10 @@
+import numpy as np
+import pandas as pd
 from pymarket.bids import BidManager
 from pymarket.mechanisms import Mechanism
 from pymarket.transactions import TransactionManager
 from pymarket.bids.demand_curves import *
+from pymarket.utils.columns import bid_arrays, bid_positions
 from collections import OrderedDict
 
 
@@ -10,6 +13,10 @@ def update_quantity(quantity, gap):
     where the long side updates their
     trading quantities to match the short side.
 
+    The quantities are sorted once and the players that
+    leave the market, always the smallest ones, are found
+    from the cumulative gap that remains after each of them.
+
     Parameters
     ----------
     quantity: np.ndarray
@@ -45,38 +52,152 @@ def update_quantity(quantity, gap):
 
     """
     quantity = quantity * 1.0
-    i_min = np.nanargmin(quantity)
-    v_min = np.nanmin(quantity)
-    #i_min = quantity[quantity > 0].argmin()
-    #v_min = quantity[quantity > 0].min()
-    end = False
     N = len(quantity)
-    while not end:
-        if v_min < gap / N:
-            quantity[i_min] = np.nan
-            N -= 1
-            gap -= v_min
-            i_min = np.nanargmin(quantity)
-            v_min = np.nanmin(quantity)
-            #i_min = quantity[quantity > 0].argmin()
-            #v_min = quantity[quantity > 0].min()
-        else:
-            end = True
+
+    # Players leave from the smallest one, while their quantity is
+    # below the share of the gap of the ones that remain.
+    valid = np.flatnonzero(~np.isnan(quantity))
+    order = valid[np.argsort(quantity[valid], kind='stable')]
+    sorted_ = quantity[order]
+    gaps = np.subtract.accumulate(np.concatenate([[gap], sorted_]))
+    k = np.arange(sorted_.shape[0])
+    stays = np.flatnonzero(sorted_ >= gaps[:-1] / (N - k))
+    if stays.shape[0] == 0:
+        raise ValueError('No quantity left to ration the gap')
+    end = stays[0]
+
+    quantity[order[: end]] = np.nan
     quantity = np.nan_to_num(quantity)
-    quantity -= float(gap) / N
+    quantity -= float(gaps[end]) / (N - end)
     max_ = quantity.max()
     quantity = np.clip(quantity, 0, max_)
     return quantity
 
 
-def huang_auction(bids):
+def huang_auction_arrays(quantity, price, buying, bid_ids=None, order=None):
+    """Array implementation of the auction described in [1]
+
+    Each side is sorted once and the same order is used to build
+    the curves and to select the trading bids, so no dataframe
+    is created.
+
+    Parameters
+    ----------
+    quantity: np.ndarray
+        Quantity of each bid
+    price: np.ndarray
+        Price of each bid
+    buying: np.ndarray
+        Side of each bid, `True` for buyers
+    bid_ids: np.ndarray or None
+        Identifier of each bid. If None, the
+        position of each bid is used.
+    order: tuple or None
+        Positions of the buyers sorted by decreasing price and of
+        the sellers sorted by increasing price. If None, both sides
+        are sorted here.
+
+    Returns
+    -------
+    bid : np.ndarray
+        Identifier of the bid in each transaction, sellers first
+    traded : np.ndarray
+        Quantity of each transaction
+    paid : np.ndarray
+        Price of each transaction
+    extra : dict
+        Extra information, as in `huang_auction`
+
+    Notes
+    ------
+    [1] Huang, Pu, Alan Scheller–Wolf, and Katia Sycara. "Design of a multi–unit
+    double auction e–market." Computational Intelligence 18.4 (2002): 596-617.
+
+    Examples
+    --------
+    >>> bid, traded, paid, extra = huang_auction_arrays(
+    ...     np.array([1, 2, 2, 0.3, 0.2]), np.array([3, 1, 2, 1, 3.3]),
+    ...     np.array([True, True, False, False, True]))
+    >>> bid, traded, paid
+    (array([3, 4]), array([0.2, 0.2]), array([2., 3.]))
+
+    """
+    quantity = np.asarray(quantity)
+    price = np.asarray(price)
+    buying = np.asarray(buying, dtype=bool)
+    if bid_ids is None:
+        bid_ids = np.arange(quantity.shape[0])
+    bid_ids = np.asarray(bid_ids)
+
+    if order is None:
+        buyers = np.flatnonzero(buying)
+        sellers = np.flatnonzero(~buying)
+        buyers = buyers[np.argsort(-price[buyers], kind='mergesort')]
+        sellers = sellers[np.argsort(price[sellers], kind='mergesort')]
+    else:
+        buyers, sellers = order
+
+    buy = np.empty((buyers.shape[0] + 1, 2))
+    buy[:-1, 0] = np.cumsum(quantity[buyers])
+    buy[:-1, 1] = price[buyers]
+    buy[-1] = [np.inf, 0]
+    sell = np.empty((sellers.shape[0] + 1, 2))
+    sell[:-1, 0] = np.cumsum(quantity[sellers])
+    sell[:-1, 1] = price[sellers]
+    sell[-1] = [np.inf, np.inf]
+
+    q_, b_, s_, _ = intersect_stepwise(buy, sell)
+
+    bid = np.zeros(0, dtype=bid_ids.dtype)
+    traded = np.zeros(0)
+    paid = np.zeros(0)
+    if b_ is None or s_ is None:
+        return bid, traded, paid, OrderedDict()
+
+    price_sell = sell[s_, 1]
+    price_buy = buy[b_, 1]
+
+    # Only the bids before the price setters trade
+    quantity_buy = quantity[buyers[: b_]]
+    quantity_sell = quantity[sellers[: s_]]
+
+    if b_ > 0 and s_ > 0:
+        gap = quantity_sell.sum() - quantity_buy.sum()
+        if gap > 0:
+            quantity_sell = update_quantity(quantity_sell, gap)
+        else:
+            quantity_buy = update_quantity(quantity_buy, - gap)
+
+        # Preallocated block with the sellers first and then the buyers
+        n = s_ + b_
+        bid = np.empty(n, dtype=bid_ids.dtype)
+        traded = np.empty(n)
+        paid = np.empty(n)
+        bid[: s_] = bid_ids[sellers[: s_]]
+        bid[s_:] = bid_ids[buyers[: b_]]
+        traded[: s_] = quantity_sell
+        traded[s_:] = quantity_buy
+        paid[: s_] = price_sell
+        paid[s_:] = price_buy
+
+    extra = OrderedDict([('price_sell', price_sell), ('price_buy', price_buy),
+                         ('quantity_traded', quantity_buy.sum())])
+    return bid, traded, paid, extra
+
+
+def huang_auction(bids, order=None):
     """Implements the auction described in [1]
 
     Parameters
     ----------
-    bids: pd.DataFrame
+    bids: pd.DataFrame or OrderedDict
         Collection of all the bids to take
-        into account by the mechanism
+        into account by the mechanism, as a dataframe
+        or as the arrays of `BidManager.get_arrays`
+    order: tuple or None
+        Identifiers of the buying and of the selling bids sorted
+        by price, as given by `BidManager.sorted_index`, to avoid
+        sorting them again.
 
     Returns
     -------
@@ -97,6 +218,8 @@ def huang_auction(bids):
     [1] Huang, Pu, Alan Scheller–Wolf, and Katia Sycara. "Design of a multi–unit
     double auction e–market." Computational Intelligence 18.4 (2002): 596-617.
 
+    See also: huang_auction_arrays, which does the computations.
+
     Examples
     --------
     No trade because price setters don't trade:
@@ -133,75 +256,218 @@ def huang_auction(bids):
 
     """
 
-    # print(bids)
-
     trans = TransactionManager()
+    columns, index = bid_arrays(bids)
+    if order is not None:
+        order = tuple(bid_positions(index, o) for o in order)
+    bid, traded, paid, extra = huang_auction_arrays(
+        columns['quantity'], columns['price'], columns['buying'], index,
+        order)
+    trans.add_transactions(bid, traded, paid, -1, False)
+    return trans, extra
 
-    buy, b_index = demand_curve_from_bids(bids)
-    sell, s_index = supply_curve_from_bids(bids)
-
-    q_, b_, s_, _ = intersect_stepwise(buy, sell)
-
-    if b_ is None or s_ is None:
-        price_sell = None
-        price_buy = None
-        quantity_bid = np.array([0, 0])
-    else:
-
-        price_sell = sell[s_, 1]
-        price_buy = buy[b_, 1]
-
-        buying_bids = bids.loc[bids['buying']].sort_values(
-            'price', ascending=False)
-        selling_bids = bids.loc[~bids['buying']
-                                ].sort_values('price', ascending=True)
-
-        # Filter only the trading bids.
-        buying_bids = buying_bids.iloc[: b_, :]
-        selling_bids = selling_bids.iloc[: s_, :]
 
-        # print(selling_bids, buying_bids)
+def _update_quantity_segments(quantity, segment, gap):
+    """Helper for huang_auction_batch. Applies `update_quantity` to
+    the quantities of all the segments at once, where `gap[s]` is
+    the gap to ration in segment `s`.
+
+    The quantities are sorted by segment and then by quantity, and
+    the gap that remains after each player leaves is found with
+    prefix sums restarted at the beginning of each segment."""
+    order = np.lexsort((quantity, segment))
+    sorted_, seg = quantity[order] * 1.0, segment[order]
+    counts = np.bincount(seg, minlength=gap.shape[0])
+    first = np.concatenate([[0], np.cumsum(counts)])
+    rank = np.arange(seg.shape[0]) - first[seg]
+    acum = np.cumsum(sorted_)
+    before = acum - sorted_ - np.concatenate([[0], acum])[first[seg]]
+    gaps = gap[seg] - before
+    stays = np.flatnonzero(sorted_ >= gaps / (counts[seg] - rank))
+
+    # First player that stays in each segment
+    end = counts.copy()
+    np.minimum.at(end, seg[stays], rank[stays])
+    nonempty = counts > 0
+    if np.any(end[nonempty] == counts[nonempty]):
+        raise ValueError('No quantity left to ration the gap')
+    share = np.zeros(gap.shape[0])
+    share[nonempty] = gaps[first[:-1][nonempty] + end[nonempty]] / \
+        (counts[nonempty] - end[nonempty])
+
+    updated = np.where(
+        rank < end[seg], 0., np.maximum(sorted_ - share[seg], 0))
+    result = np.empty(quantity.shape[0])
+    result[order] = updated
+    return result
+
+
+def _segment_curves(quantity, price, segment, n_segments, end_price):
+    """Helper for huang_auction_batch. Packs one stepwise curve
+    per segment, with the steps already sorted by segment and then
+    by price, adding the point at infinity at the end of each curve.
+
+    Returns the packed curves, their offsets and the rank of each
+    step inside its curve."""
+    counts = np.bincount(segment, minlength=n_segments)
+    offsets = np.concatenate([[0], np.cumsum(counts + 1)])
+    first = np.concatenate([[0], np.cumsum(counts)])
+    rank = np.arange(segment.shape[0]) - first[segment]
+    acum = np.cumsum(quantity)
+    base = np.concatenate([[0], acum])[first[:-1]]
+    curves = np.empty((offsets[-1], 2))
+    curves[offsets[1:] - 1] = [np.inf, end_price]
+    position = offsets[segment] + rank
+    curves[position, 0] = acum - base[segment]
+    curves[position, 1] = price
+    return curves, offsets, rank
+
+
+def huang_auction_batch(bids, slot='slot', merge=True, prec=5):
+    """Clears an independent Huang auction [1] in each time slot.
+
+    The bids of all the slots are sorted together once, players with
+    the same price in the same side and slot are merged (as done by
+    `HuangAuction`), all the intersections are found with
+    `intersect_stepwise_batch`, the long side of every slot is rationed
+    at once with prefix sums restarted at each slot, and the
+    transactions of merged players are split proportionally to their
+    quantities. The result is the
+    same as running `HuangAuction` in each slot, up to floating point
+    rounding of the cumulative quantities.
 
-        quantity_buy = buying_bids.quantity.values
-        quantity_sell = selling_bids.quantity.values
+    Parameters
+    ----------
+    bids: pd.DataFrame
+        Collection of the bids of all the slots
+    slot: str
+        Name of the column with the slot of each bid
+    merge: bool
+        Wheather to merge players with the same price
+    prec: int
+        Number of digits used to compare prices when merging
 
-    if b_ is not None and b_ > 0 and s_ is not None and s_ > 0:
+    Returns
+    -------
+    trans : pd.DataFrame
+        All the transactions, with a `slot` column followed by the
+        columns of `TransactionManager`. In each slot, sellers
+        come before buyers.
+    extra : pd.DataFrame
+        One row per slot with `price_sell`, `price_buy` and
+        `quantity_traded`. Prices are NaN in the slots where
+        demand and supply do not intersect.
 
+    Notes
+    ------
+    [1] Huang, Pu, Alan Scheller–Wolf, and Katia Sycara. "Design of a multi–unit
+    double auction e–market." Computational Intelligence 18.4 (2002): 596-617.
 
-        #long_sellers = sell[s_ - 1, 0] > buy[b_ - 1, 0]
-        #gap = sell[s_ - 1, 0] - buy[b_ - 1, 0]
-        gap = quantity_sell.sum() - quantity_buy.sum()
-        if gap > 0:
-            quantity_sell = update_quantity(quantity_sell, gap)
-        else:
-            quantity_buy = update_quantity(quantity_buy, - gap)
+    Examples
+    --------
+    >>> bm = pm.BidManager()
+    >>> bm.add_bids([1, 2, 2, 0.3, 0.2], [3, 1, 2, 1, 3.3], 0,
+    ...             [True, True, False, False, True])
+    range(0, 5)
+    >>> bids = pd.concat([bm.get_df().assign(slot=0), bm.get_df().assign(slot=1)],
+    ...                  ignore_index=True)
+    >>> trans, extra = huang_auction_batch(bids)
+    >>> trans
+       slot  bid  quantity  price  source  active
+    0     0    3       0.2    2.0      -1   False
+    1     0    4       0.2    3.0      -1   False
+    2     1    8       0.2    2.0      -1   False
+    3     1    9       0.2    3.0      -1   False
+    >>> extra.reset_index()
+       slot  price_sell  price_buy  quantity_traded
+    0     0         2.0        3.0              0.2
+    1     1         2.0        3.0              0.2
 
-        for (i, x), q in zip(selling_bids.iterrows(), quantity_sell):
-            # print(i)
-            t = (i, q, price_sell, -1, False)
-            trans.add_transaction(*t)
-
-        for (i, x), q in zip(buying_bids.iterrows(), quantity_buy):
-            # print(i)
-            t = (i, q, price_buy, -1, False)
-            trans.add_transaction(*t)
-
-    #    for i in range(s_):
-    #        id_ = s_index[i]
-    #        trans.add_transaction(id_, quantity_sell[i],
-    #                price_sell, -1, False)
-
-    #    for i in range(b_):
-    #        id_ = b_index[i]
-    #        trans.add_transaction(id_, quantity_buy[i],
-    #                price_buy, -1, False)
-    
-    if b_ is None or s_ is None:
-        extra = OrderedDict()
-    else:
-        extra = OrderedDict([('price_sell', price_sell), ('price_buy', price_buy),
-                 ('quantity_traded', quantity_buy.sum())])
-    # print(trans.get_df())
+    """
+    slots, code = np.unique(bids[slot].values, return_inverse=True)
+    n_slots = slots.shape[0]
+    quantity = bids.quantity.values.astype('float64')
+    price = bids.price.values.astype('float64')
+    buying = bids.buying.values.astype(bool)
+    if merge:
+        price = np.round(price, prec)
+
+    # Sort by slot, buyers first, and then by price
+    order = np.lexsort((np.where(buying, -price, price), ~buying, code))
+    s_code, s_buying, s_price = code[order], buying[order], price[order]
+    new = np.ones(order.shape[0], dtype=bool)
+    if merge:
+        new[1:] = (s_code[1:] != s_code[:-1]) | \
+            (s_buying[1:] != s_buying[:-1]) | (s_price[1:] != s_price[:-1])
+    starts = np.flatnonzero(new)
+    group = np.cumsum(new) - 1
+    g_quantity = np.add.reduceat(quantity[order], starts) \
+        if starts.shape[0] > 0 else np.zeros(0)
+    g_price, g_slot, g_buying = s_price[starts], s_code[starts], s_buying[starts]
+
+    buyers = np.flatnonzero(g_buying)
+    sellers = np.flatnonzero(~g_buying)
+    f, f_offsets, b_rank = _segment_curves(
+        g_quantity[buyers], g_price[buyers], g_slot[buyers], n_slots, 0)
+    g, g_offsets, s_rank = _segment_curves(
+        g_quantity[sellers], g_price[sellers], g_slot[sellers], n_slots,
+        np.inf)
+    _, b_, s_, _ = intersect_stepwise_batch(f, f_offsets, g, g_offsets)
+
+    found = b_ >= 0
+    price_buy = np.full(n_slots, np.nan)
+    price_sell = np.full(n_slots, np.nan)
+    price_buy[found] = f[f_offsets[:-1][found] + b_[found], 1]
+    price_sell[found] = g[g_offsets[:-1][found] + s_[found], 1]
+
+    # Only the players before the price setters trade
+    trade_buy = buyers[b_rank < np.maximum(b_, 0)[g_slot[buyers]]]
+    trade_sell = sellers[s_rank < np.maximum(s_, 0)[g_slot[sellers]]]
+    both = found & (b_ > 0) & (s_ > 0)
+
+    # The long side of each slot rations the gap with the short side
+    traded = g_quantity.copy()
+    gap = np.bincount(
+        g_slot[trade_sell], weights=g_quantity[trade_sell],
+        minlength=n_slots) - np.bincount(
+        g_slot[trade_buy], weights=g_quantity[trade_buy], minlength=n_slots)
+    long_sell = gap > 0
+    long_side = np.concatenate([
+        trade_sell[both[g_slot[trade_sell]] & long_sell[g_slot[trade_sell]]],
+        trade_buy[both[g_slot[trade_buy]] & ~long_sell[g_slot[trade_buy]]]])
+    traded[long_side] = _update_quantity_segments(
+        g_quantity[long_side], g_slot[long_side], np.abs(gap))
+
+    quantity_traded = np.bincount(
+        g_slot[trade_buy], weights=traded[trade_buy], minlength=n_slots)
+    extra = pd.DataFrame(
+        OrderedDict([('price_sell', price_sell), ('price_buy', price_buy),
+                     ('quantity_traded', quantity_traded)]),
+        index=pd.Index(slots, name=slot))
+
+    # Groups that trade, sellers before buyers in each slot
+    trading = np.concatenate([trade_sell, trade_buy])
+    trading = trading[both[g_slot[trading]]]
+    trading = trading[np.lexsort((g_buying[trading], g_slot[trading]))]
+    rank = np.full(g_quantity.shape[0], -1)
+    rank[trading] = np.arange(trading.shape[0])
+
+    # Split each group into its bids
+    positions = np.flatnonzero(rank[group] >= 0)
+    positions = positions[np.argsort(rank[group[positions]], kind='stable')]
+    members = group[positions]
+    rows = order[positions]
+    share = quantity[rows] / g_quantity[members]
+    paid = np.where(g_buying[members], price_buy[g_slot[members]],
+                    price_sell[g_slot[members]])
+
+    trans = pd.DataFrame(OrderedDict([
+        (slot, slots[g_slot[members]]),
+        ('bid', bids.index.values[rows]),
+        ('quantity', traded[members] * share),
+        ('price', paid),
+        ('source', -1),
+        ('active', False)]))
     return trans, extra
 
 
@@ -219,6 +485,8 @@ class HuangAuction(Mechanism):
 
     """
 
+    accepts_arrays = True
+
     def __init__(self, bids, *args, **kwargs):
         """
         """
@@ -1,6 +1,7 @@
+import numpy as np
 import pandas as pd
 
-from pymarket.bids.processing import merge_same_price
+from pymarket.bids.processing import merge_same_price_arrays
 from pymarket.transactions.processing import split_transactions_merged_players
 from pymarket.transactions.transactions import TransactionManager
 from collections import OrderedDict
@@ -20,13 +21,25 @@ class Mechanism():
         Collection of bids to use, with processing.
     old_bids: pd.DataFrame
         Collection of bids previous to proecssing.
-    maping: dict
-        Map from the new bids to the old bids
+    maping: tuple
+        Map from the new bids to the old bids, as the
+        tuple `(offsets, bid_ids)` where the old bids of the
+        new bid `i` are `bid_ids[offsets[i]: offsets[i + 1]]`.
     merge : bool
         Wheather to merge different players with
         the same price into one player. Useful for
         algorithms that require players to have different
         prices.
+    accepts_arrays : bool
+        Wheather the algorithm also accepts the bids as the
+        arrays returned by `BidManager.get_arrays`, so that the
+        market does not need to build a dataframe, and an `order`
+        with the bids of each side already sorted.
+    order : tuple or None
+        Identifiers of the buying and of the selling bids sorted by
+        price, as given by `BidManager.sorted_index`. If given, it is
+        passed to the algorithm (after merging, if needed) so that the
+        bids are not sorted again.
 
     Examples
     ---------
@@ -69,7 +82,10 @@ class Mechanism():
     3    2         0    0.0       1    True
     """
 
-    def __init__(self, algo, bids, *args, merge=False, **kwargs):
+    accepts_arrays = False
+
+    def __init__(self, algo, bids, *args, merge=False, order=None,
+                 **kwargs):
         """Creates a mechanisms with bids
 
         """
@@ -77,6 +93,7 @@ class Mechanism():
         self.args = args
         self.kwargs = kwargs
         self.merge = merge
+        self.order = order
         self.bids = self._sanitize_bids(bids)
 
     def _sanitize_bids(self, bids):
@@ -87,15 +104,18 @@ class Mechanism():
 
         Parameters
         ----------
-        bids: pd.DataFrame
-            Collection of unprocess bids.
+        bids: pd.DataFrame or OrderedDict
+            Collection of unprocess bids, as a dataframe or
+            as the arrays of `BidManager.get_arrays`.
 
         Returns
         -------
-        new_bids: pd.DataFrame
-            The set of bids after processing.
-        maping: dict
-            Maping from new bids to old bids.
+        new_bids: pd.DataFrame or OrderedDict
+            The set of bids after processing, in the
+            same format as `bids`.
+        maping: tuple
+            Maping from new bids to old bids, as
+            `(offsets, bid_ids)`.
 
 
         Raises
@@ -113,15 +133,25 @@ class Mechanism():
         >>> new_bids = mec._sanitize_bids(bm.get_df())
         >>> new_bids
            quantity  price  user  buying  time  divisible
-        0       1.5      1   2.0     1.0   0.0        1.0
+        0       1.5    1.0     2    True     0       True
         >>> mec.maping
-        {0: [0, 1]}
+        (array([0, 2]), array([0, 1]))
         """
         if self.merge:
             self.old_bids = bids
-            new_bids, maping = merge_same_price(bids)
-            # print(maping)
-            self.maping = maping
+            columns, offsets, bid_ids = merge_same_price_arrays(
+                bids, order=self.order)
+            if self.order is not None:
+                # Merged bids come sorted, with unique prices per side
+                n_buy = int(np.count_nonzero(columns['buying']))
+                n_bids = columns['buying'].shape[0]
+                self.order = (np.arange(n_buy)[::-1],
+                              np.arange(n_buy, n_bids))
+            if isinstance(bids, pd.DataFrame):
+                new_bids = pd.DataFrame(columns, columns=bids.columns)
+            else:
+                new_bids = columns
+            self.maping = (offsets, bid_ids)
         else:
             new_bids = bids
 
@@ -129,10 +159,13 @@ class Mechanism():
 
     def _run(self):
         """Runs the mechanisms"""
-        bids = self.bids
-        N = bids.shape[0]
-        if (bids.loc[bids['buying']].shape[0] not in [0, N]):
-            trans, extra = self.algo(self.bids, *self.args, **self.kwargs)
+        buying = np.asarray(self.bids['buying'], dtype=bool)
+        N = buying.shape[0]
+        if (np.count_nonzero(buying) not in [0, N]):
+            kwargs = self.kwargs
+            if self.order is not None:
+                kwargs = dict(kwargs, order=self.order)
+            trans, extra = self.algo(self.bids, *self.args, **kwargs)
             return trans, extra
         else:
             trans = TransactionManager()
@@ -1,16 +1,23 @@
 import numpy as np
 import pandas as pd
-from pymarket.bids import BidManager, merge_same_price
-from pymarket.transactions import TransactionManager, \
-    split_transactions_merged_players
+from pymarket.bids import BidManager
+from pymarket.transactions import TransactionManager
 from pymarket.bids.demand_curves import *
 from pymarket.mechanisms import Mechanism
-from pymarket.utils.decorators import check_equal_price
+from pymarket.utils.decorators import check_equal_price, \
+    validate_equal_price
+from pymarket.utils.columns import bid_arrays, bid_positions
 from collections import OrderedDict
 
+# Bytes of the temporaries of muda_monte_carlo for each partition and
+# bid of a block. The peak is reached in `_batch_fees`, with about a
+# dozen matrices of floats with a column per bid or per segment of the
+# long side alive at once.
+_BYTES_PER_DRAW_AND_BID = 128
+
 
 @check_equal_price
-def muda(bids, r=None):
+def muda(bids, r=None, order=None):
     """Implements the Vickrey MUDA as described in [1].
 
     The mechanism does not support two players in the
@@ -18,12 +25,17 @@ def muda(bids, r=None):
 
     Parameters
     ----------
-    bids: pd.DataFrame
-        Collection of bids to be used in the market
+    bids: pd.DataFrame or OrderedDict
+        Collection of bids to be used in the market, as a
+        dataframe or as the arrays of `BidManager.get_arrays`
     r: np.random.RandomState
         A numpy random state generator. If not given,
         a new one will be created and the output will
         be random.
+    order: tuple or None
+        Identifiers of the buying and of the selling bids sorted
+        by price, as given by `BidManager.sorted_index`, to avoid
+        sorting them again.
 
     Returns
     -------
@@ -103,20 +115,38 @@ def muda(bids, r=None):
     if r is None:
         r = np.random.RandomState()
 
-    left = [i for i in bids.index if r.rand() > 0.5]
-    right = [i for i in bids.index if i not in left]
+    columns, index = bid_arrays(bids)
+    quantity = np.asarray(columns['quantity'])
+    price = np.asarray(columns['price'])
+    user = np.asarray(columns['user'])
+    buying = np.asarray(columns['buying'], dtype=bool)
 
-    pl = find_competitive_price(bids.loc[left])
-    pr = find_competitive_price(bids.loc[right])
+    in_left = r.rand(index.shape[0]) > 0.5
+    left = index[in_left].tolist()
+    right = index[~in_left].tolist()
 
-    fees = np.zeros(bids.user.unique().shape[0])
+    if order is None:
+        buyers, sellers = _sorted_sides(price, buying)
+    else:
+        buyers, sellers = (bid_positions(index, o) for o in order)
+    pl = _competitive_price(
+        quantity, price, buyers[in_left[buyers]], sellers[in_left[sellers]])
+    pr = _competitive_price(
+        quantity, price, buyers[~in_left[buyers]],
+        sellers[~in_left[sellers]])
 
-    trans_left, fees = solve_market_side_with_exogenous_price(
-        bids.loc[left], pr, fees)
-    trans_right, fees = solve_market_side_with_exogenous_price(
-        bids.loc[right], pl, fees)
+    fees = np.zeros(pd.unique(user).shape[0])
 
-    trans = trans_left.merge(trans_right)
+    trans = TransactionManager()
+    for market, other_price in [(in_left, pr), (~in_left, pl)]:
+        b = buyers[market[buyers]]
+        s = sellers[market[sellers]]
+        _, bid, traded, users, user_fees = _clear_side_arrays(
+            quantity[b], price[b], quantity[s], price[s], user[b], user[s],
+            other_price, index[b], index[s])
+        fees[users] = user_fees
+        if bid.shape[0] > 0:
+            trans.add_transactions(bid, traded, other_price, -1, False)
 
     extra = OrderedDict([
         ('left', left),
@@ -140,8 +170,9 @@ def solve_market_side_with_exogenous_price(
 
     Parameters
     ----------
-    bids : pd.DataFrame
-        Collection of bids to clear the market with
+    bids : pd.DataFrame or OrderedDict
+        Collection of bids to clear the market with, as a
+        dataframe or as the arrays of `BidManager.get_arrays`
     price : float
         Price at which all the trades will ocurr
     fees: list of floats
@@ -177,53 +208,81 @@ def solve_market_side_with_exogenous_price(
     >>> fees
     [0, 0, 0.5, 0]
 
+    See also: `_clear_side_arrays`, which does the computations.
+
     """
+    columns, index = bid_arrays(bids)
+    quantity = np.asarray(columns['quantity'])
+    prices = np.asarray(columns['price'])
+    user = np.asarray(columns['user'])
+    buyers, sellers = _sorted_sides(
+        prices, np.asarray(columns['buying'], dtype=bool))
+
     trans = TransactionManager()
-    demand = bids.loc[bids['buying']]
-    if demand.shape[0] > 0:
-        demand = demand.query('price >= @price')
-        demand = demand.sort_values('price', ascending=False)
-    else:
-        return trans, fees
-    supply = bids.loc[~bids['buying']]
-    if supply.shape[0] > 0:
-        supply = supply.query('price <= @price')
-        supply = supply.sort_values('price')
-    else:
-        return trans, fees
-    supply_quantity = supply.quantity.sum()
-    demand_quantity = demand.quantity.sum()
+    _, bid, traded, users, user_fees = _clear_side_arrays(
+        quantity[buyers], prices[buyers], quantity[sellers],
+        prices[sellers], user[buyers], user[sellers], price,
+        index[buyers], index[sellers])
+    if bid.shape[0] > 0:
+        trans.add_transactions(bid, traded, price, -1, False)
+    for u, fee in zip(users, user_fees):
+        fees[u] = fee
+    return trans, fees
 
-    # Deal with the short side of the demand
-    supply_long = supply_quantity > demand_quantity
-    long_side = supply if supply_long else demand
-    short_side = demand if supply_long else supply
-    total_quantity = demand_quantity if supply_long else supply_quantity
-    if total_quantity > 0:
 
-        long_side, l_index = get_trading_bids(long_side, total_quantity)
-        short_side, s_index = get_trading_bids(short_side, total_quantity)
+def get_trading_cut(quantities, quantity_traded):
+    """
+    Finds the rightmost trading bid in a side of the
+    market and the quantity that it trades, without
+    splitting it.
 
-        for i, x in short_side.iterrows():
-            if i <= s_index:
-                t = (x.bid, x.quantity, price, -1, False)
-                trans.add_transaction(*t)
+    Parameters
+    ----------
+    quantities : np.ndarray
+        Quantity of each bid of one side of the market.
+        Precondition: the bids are sorted by price, in reverse
+        order for the buying side.
+    quantity_traded : float
+        Total quantity that the side of the market
+        can trade.
 
-        for i, x in long_side.iterrows():
-            if i <= l_index:
-                t = (x.bid, x.quantity, price, -1, False)
-                trans.add_transaction(*t)
+    Returns
+    -------
+    bid_index : int
+        Position of the `worst` bid that gets to trade.
+    partial : float
+        Quantity traded by that bid. If it is smaller than
+        the quantity of the bid, the rest is left out of the
+        market, as in the split done by `get_trading_bids`.
 
-        trading_users_long_side = (
-            long_side[long_side.index <= l_index]
-            .user
-            .unique()
-        )
-        for u in trading_users_long_side:
-            fee = compute_fee(long_side, l_index, u, total_quantity, price)
-            fees[u] = fee
+    Examples
+    ---------
 
-    return trans, fees
+    >>> get_trading_cut(np.array([1, 1]), 1)
+    (0, 1)
+    >>> get_trading_cut(np.array([1, 1]), 0.3)
+    (0, 0.3)
+    """
+    quantities = np.asarray(quantities)
+    if quantities.sum() > quantity_traded:
+        bid_index = int(np.argmax(np.cumsum(quantities) >= quantity_traded))
+    else:
+        bid_index = quantities.shape[0] - 1
+    diff = quantity_traded - quantities[: bid_index].sum()
+    return bid_index, min(diff, quantities[bid_index])
+
+
+def _split_cut(index, partial, quantities, *columns):
+    """Helper to build the arrays of a side of the market with
+    the bid at `index` split as done by `get_trading_bids`"""
+    quantities = np.asarray(quantities, dtype='float64')
+    if partial >= quantities[index]:
+        return (quantities,) + columns
+    quantities = np.concatenate([
+        quantities[:index], [partial, quantities[index] - partial],
+        quantities[index + 1:]])
+    return (quantities,) + tuple(
+        np.insert(c, index, c[index]) for c in columns)
 
 
 def get_trading_bids(
@@ -261,6 +320,11 @@ def get_trading_bids(
     bid_index: int
         Index of the `worst` bid that gets to trade.
 
+    Notes
+    ------
+    The mechanism itself uses `get_trading_cut`, which
+    gives the same information without building a new dataframe.
+
     Examples
     ---------
 
@@ -306,13 +370,7 @@ def get_trading_bids(
 
     """
 
-    if bids.quantity.sum() > quantity_traded:
-        bid_index = np.argmax(bids.quantity.cumsum().values >= quantity_traded)
-    else:
-        bid_index = bids.shape[0] - 1
-
-    quantity_but_last = bids.iloc[: bid_index, :].quantity.sum()
-    diff = quantity_traded - quantity_but_last
+    bid_index, diff = get_trading_cut(bids.quantity.values, quantity_traded)
     if diff < bids.iloc[bid_index, :].quantity:
         new_row = pd.DataFrame(bids.iloc[bid_index, :]).T
 
@@ -400,6 +458,124 @@ def compute_fee(
     return fee
 
 
+def compute_fees(
+    df,
+    index,
+    quantity,
+    price,
+    users=None,
+    partial=None):
+    """Computes at once the fees of many users of
+    the same side of the market, as `compute_fee` does
+    for a single one.
+
+    Without a user, the bids that take its place are the
+    ones after `index` until the quantity is covered again.
+    All the sums needed are read from prefix sums of the quantity
+    and of the value of the bids, both for the whole side and for
+    the bids of each user, and the last bid that enters the market
+    is found with a binary search done for all the users together.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataframe for one side of the market, as
+        returned by `get_trading_bids`, or the sorted side
+        without splitting if `partial` is given.
+        Precondition: all bids should be willing
+        to trade at the trading price.
+    index : int
+        Index of the last trading bid
+    quantity : float
+        Total quantity that the side of the
+        market trades
+    price : float
+        Price at which the market clears.
+    users : list of int or None
+        Users for which the fee should be computed.
+        If None, all the users in `df`, in order of appearance.
+    partial : float or None
+        Quantity traded by the last trading bid, as
+        returned by `get_trading_cut`.
+
+    Returns
+    -------
+    fees : np.ndarray
+        Fee of each user of `users`.
+
+    Examples
+    --------
+
+    >>> bm = pm.BidManager()
+    >>> bm.add_bid(1, 1, 1)
+    0
+    >>> bm.add_bid(1, 2, 3)
+    1
+    >>> compute_fees(bm.get_df(), 0, 1, 2.5)
+    array([0.5, 0. ])
+    >>> compute_fees(bm.get_df(), 0, 0.5, 2.5, partial=0.5)
+    array([0.25, 0.  ])
+    """
+    if users is None:
+        users = pd.unique(df.user)
+    q = df.quantity.values.astype('float64')
+    p = df.price.values.astype('float64')
+    user = df.user.values
+    if partial is not None:
+        q, p, user = _split_cut(index, partial, q, p, user)
+    return _long_side_fees(
+        q, p, user, index, quantity, price, np.asarray(users))
+
+
+def _long_side_fees(q, p, user, index, quantity, price, users):
+    """Array implementation of `compute_fees`"""
+    uniques, codes = np.unique(user, return_inverse=True)
+    u = np.searchsorted(uniques, users)
+    n = codes.shape[0]
+    n_users = uniques.shape[0]
+
+    value = (p - price) * q
+    acum_q = np.cumsum(q)
+    acum_value = np.cumsum(value)
+
+    # Prefix sums of the bids of each user, grouped by user
+    by_user = np.argsort(codes, kind='stable')
+    keys = codes[by_user] * (n + 1) + by_user
+    first = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=n_users))])
+    user_q = np.concatenate([[0], np.cumsum(q[by_user])])
+    user_value = np.concatenate([[0], np.cumsum(value[by_user])])
+
+    def user_prefix(acum, j):
+        """Sum of the bids of each user up to position j"""
+        k = np.searchsorted(keys, u * (n + 1) + j, side='right')
+        return acum[np.maximum(k, first[u])] - acum[first[u]]
+
+    # First position where the others cover the quantity
+    lo = np.zeros(u.shape[0], dtype='int64')
+    hi = np.full(u.shape[0], n, dtype='int64')
+    while np.any(lo < hi):
+        active = lo < hi
+        mid = np.where(active, (lo + hi) // 2, 0)
+        covered = acum_q[mid] - user_prefix(user_q, mid) >= quantity
+        hi = np.where(active & covered, mid, hi)
+        lo = np.where(active & ~covered, mid + 1, lo)
+
+    # If they never cover it, the last bid of the others enters
+    run_start = np.flatnonzero(np.append(True, codes[1:] != codes[:-1]))
+    last_other = np.where(codes[-1] == u, run_start[-1] - 1, n - 1)
+    j = np.where(lo == n, last_other, lo)
+    empty = j < 0
+    j = np.maximum(j, 0)
+
+    before = acum_q[j] - q[j] - user_prefix(user_q, j)
+    last_q = np.minimum(quantity - before, q[j])
+    total = (acum_value[j] - acum_value[index]) - \
+        (user_prefix(user_value, j) - user_prefix(user_value, index))
+    total += (p[j] - price) * (last_q - q[j])
+    fees = np.where((j > index) & ~empty, np.abs(total), 0.)
+    return fees
+
+
 def find_competitive_price(bids):
     """
     Finds the unique trading price of the intersection
@@ -407,9 +583,9 @@ def find_competitive_price(bids):
 
     Parameters
     ----------
-    bids: pd.DataFrame
-        Collection of bids to process the
-        mechanism with.
+    bids: pd.DataFrame or OrderedDict
+        Collection of bids to process the mechanism with, as
+        a dataframe or as the arrays of `BidManager.get_arrays`
 
     Returns
     -------
@@ -418,15 +594,398 @@ def find_competitive_price(bids):
 
     Notes
     ------
-    See also: intersect_stepwise.
+    See also: intersect_stepwise, and `_competitive_price`,
+    which does the computations.
     """
+    columns, _ = bid_arrays(bids)
+    price = np.asarray(columns['price'])
+    buyers, sellers = _sorted_sides(
+        price, np.asarray(columns['buying'], dtype=bool))
+    return _competitive_price(
+        np.asarray(columns['quantity']), price, buyers, sellers)
+
+
+def _sorted_sides(price, buying):
+    """Positions of the buyers sorted by decreasing price and
+    of the sellers sorted by increasing price. The sorts are stable,
+    so bids with the same price keep their order."""
+    buyers = np.flatnonzero(buying)
+    buyers = buyers[np.argsort(-price[buyers], kind='stable')]
+    sellers = np.flatnonzero(~buying)
+    sellers = sellers[np.argsort(price[sellers], kind='stable')]
+    return buyers, sellers
+
+
+def _competitive_price(quantity, price, buyers, sellers):
+    """Same as `find_competitive_price` for the bids in the
+    positions `buyers` and `sellers`, already sorted by price"""
+    demand = np.empty((buyers.shape[0] + 1, 2))
+    demand[:-1, 0] = np.cumsum(quantity[buyers])
+    demand[:-1, 1] = price[buyers]
+    demand[-1] = [np.inf, 0]
+    supply = np.empty((sellers.shape[0] + 1, 2))
+    supply[:-1, 0] = np.cumsum(quantity[sellers])
+    supply[:-1, 1] = price[sellers]
+    supply[-1] = [np.inf, np.inf]
+    return intersect_stepwise(demand, supply)[3]
+
+
+def _masked_cumsum(mask, values):
+    """Helper for muda_monte_carlo. Cumulative sum of `values`
+    over the bids selected in each row of `mask`, with a first
+    column of zeros."""
+    acum = np.zeros((mask.shape[0], mask.shape[1] + 1))
+    np.cumsum(mask * values, axis=1, out=acum[:, 1:])
+    return acum
+
+
+def _step_values(mask, acum, price, x, end):
+    """Helper for muda_monte_carlo. Value in `x[i]` of the
+    stepwise curve made by the bids selected in the row `i` of
+    `mask`, which is the price of the first of them whose cumulative
+    quantity reaches `x[i]`, or `end` if there is none. Also returns
+    if `x[i]` is a breakpoint of the curve."""
+    n_rows = x.shape[0]
+    if price.shape[0] == 0:
+        return np.full(n_rows, end), np.zeros(n_rows, dtype=bool)
+    reach = mask & (acum[:, 1:] >= x[:, None])
+    first = reach.argmax(axis=1)
+    rows = np.arange(n_rows)
+    found = reach[rows, first]
+    values = np.where(found, price[first], end)
+    return values, found & (acum[rows, first + 1] == x)
+
+
+def _batch_competitive_prices(buy, sell, q_buy, p_buy, q_sell, p_sell,
+                              cheaper, dearer):
+    """Helper for muda_monte_carlo. Same as `_competitive_price` for
+    the buyers selected in each row of `buy` and the sellers selected
+    in each row of `sell`, without building the curves.
+
+    As in `intersect_stepwise`, the price comes from the last
+    breakpoint where the demand is above the supply and below it in
+    the next one. The demand is above the supply in the breakpoint
+    of a buyer if the sellers cheaper than it cover its cumulative
+    quantity, and in the one of a seller if the buyers dearer than it
+    do. `cheaper` and `dearer` are the number of sellers cheaper than
+    each buyer and of buyers dearer than each seller."""
+    n_rows = buy.shape[0]
+    acum_buy = _masked_cumsum(buy, q_buy)
+    acum_sell = _masked_cumsum(sell, q_sell)
+    x_buy, x_sell = acum_buy[:, 1:], acum_sell[:, 1:]
+
+    # After the last buyer the demand is 0, so it is not increasing
+    # before and after it and can cross the supply once in each part
+    demand = acum_buy[:, -1:]
+    above_buy = buy & (x_buy > 0) & (acum_sell[:, cheaper] >= x_buy)
+    above_sell = sell & (x_sell > 0) & np.where(
+        x_sell <= demand, acum_buy[:, dearer] >= x_sell, p_sell < 0)
+    x_before = np.maximum(
+        np.max(np.where(above_buy, x_buy, -1.), axis=1, initial=-1.),
+        np.max(np.where(above_sell & (x_sell <= demand), x_sell, -1.),
+               axis=1, initial=-1.))
+    x_after = np.max(np.where(above_sell & (x_sell > demand), x_sell, -1.),
+                     axis=1, initial=-1.)
+    # Bids without quantity make 0 a breakpoint
+    zeros = np.zeros(n_rows)
+    f_val, in_f = _step_values(buy, acum_buy, p_buy, zeros, 0)
+    g_val, in_g = _step_values(sell, acum_sell, p_sell, zeros, np.inf)
+    x_before[(x_before < 0) & (in_f | in_g) & (f_val > g_val)] = 0
+
+    # The demand has to be below the supply in the next breakpoint,
+    # and the last crossing is kept
+    x_ast = x_before
+    found = np.zeros(n_rows, dtype=bool)
+    for x in [x_before, x_after]:
+        if not np.any(x >= 0):
+            continue
+        x_next = np.minimum(
+            np.min(np.where(buy & (x_buy > x[:, None]), x_buy, np.inf),
+                   axis=1, initial=np.inf),
+            np.min(np.where(sell & (x_sell > x[:, None]), x_sell, np.inf),
+                   axis=1, initial=np.inf))
+        f_next, _ = _step_values(buy, acum_buy, p_buy, x_next, 0)
+        g_next, _ = _step_values(sell, acum_sell, p_sell, x_next, np.inf)
+        crossing = (x >= 0) & (f_next < g_next)
+        x_ast = np.where(crossing, x, x_ast)
+        found |= crossing
+
+    f_val, in_f = _step_values(buy, acum_buy, p_buy, x_ast, 0)
+    g_val, in_g = _step_values(sell, acum_sell, p_sell, x_ast, np.inf)
+    v = g_val * 0.5 + 0.5 * f_val
+    only_one = found & ~(in_f & in_g)
+    v[only_one] = np.where(in_f, g_val, f_val)[only_one]
+    v[~found] = np.inf
+    return v
+
+
+def _user_segments(user):
+    """Helper for muda_monte_carlo, computed once per side of the
+    book. Groups the bids by user and splits the book, for each user,
+    in the segments before its first bid, between two of its bids and
+    after the last one.
+
+    Returns the users, the positions of their bids grouped by user,
+    the start of each group and the segments: their start and end in
+    the book, the columns of the prefix sums grouped by user of the
+    previous bid of the user and of the start of its group, and the
+    first segment of each user."""
+    n = user.shape[0]
+    users, codes = np.unique(user, return_inverse=True)
+    by_user = np.argsort(codes, kind='stable')
+    counts = np.bincount(codes, minlength=users.shape[0])
+    first = np.concatenate([[0], np.cumsum(counts)])
+    start = np.insert(by_user + 1, first[:-1], 0)
+    end = np.insert(by_user, first[1:], n)
+    previous = np.insert(np.arange(1, n + 1), first[:-1], first[:-1])
+    base = np.repeat(first[:-1], counts + 1)
+    first_segment = first[:-1] + np.arange(users.shape[0])
+    segments = (start, end, previous, base, first_segment)
+    return users, by_user, first, segments
+
+
+def _batch_fees(mask, q, p, price, quantity, groups):
+    """Helper for muda_monte_carlo. Same as `_long_side_fees` for
+    the long side selected in each row of `mask`, trading `quantity`
+    at `price`, with the users grouped by `_user_segments`.
+
+    The fee of a user is the value of the bids of the others between
+    the quantity they trade and the one they would trade without it.
+    Inside a segment of a user its own prefix sums are constant, so
+    the segment where the others cover `quantity` is read from the
+    prefix sums at the end of each segment, and the bid inside it is
+    found with a binary search done for every row and user together.
+
+    Returns the fee of each user in each row and if it trades."""
+    _, by_user, first, (start, end, previous, base, first_segment) = groups
+    quantity = quantity[:, None]
+    value = q * (p - price[:, None])
+    acum = _masked_cumsum(mask, q)
+    acum_value = _masked_cumsum(mask, value)
+    own = _masked_cumsum(mask[:, by_user], q[by_user])
+    own_value = _masked_cumsum(mask[:, by_user], value[:, by_user])
+
+    # Quantity traded by each bid and each user
+    traded = np.minimum(mask * q, np.maximum(quantity - acum[:, :-1], 0))
+    trades = mask & ((acum[:, :-1] < quantity) | (acum[:, -1:] <= quantity))
+    user_traded = np.add.reduceat(traded[:, by_user], first[:-1], axis=1)
+    traded *= p - price[:, None]
+    user_traded_value = np.add.reduceat(
+        traded[:, by_user], first[:-1], axis=1)
+    trading = np.logical_or.reduceat(trades[:, by_user], first[:-1], axis=1)
+    others = acum[:, -1:] - (own[:, first[1:]] - own[:, first[:-1]])
+
+    # Others' value without the user, until they cover the quantity
+    # or run out of bids
+    without = acum_value[:, -1:] - (
+        own_value[:, first[1:]] - own_value[:, first[:-1]])
+
+    # First segment where the others cover the quantity
+    shift = own[:, previous] - own[:, base]
+    target = quantity + shift
+    covers = (end > start) & (acum[:, end] >= target)
+    segment = np.minimum.reduceat(
+        np.where(covers, np.arange(end.shape[0]), end.shape[0]),
+        first_segment, axis=1)
+    row, column = np.nonzero(
+        trading & (others > quantity) & (segment < end.shape[0]))
+    segment = segment[row, column]
+    target = target[row, segment]
+
+    # and first bid inside it
+    lo, hi = start[segment], end[segment]
+    while np.any(lo < hi):
+        mid = (lo + hi) // 2
+        covered = acum[row, mid + 1] >= target
+        hi = np.where(covered, mid, hi)
+        lo = np.where(covered, lo, mid + 1)
+    without[row, column] = acum_value[row, lo + 1] - (
+        own_value[row, previous[segment]] - own_value[row, base[segment]]) - \
+        (p[lo] - price[row]) * (acum[row, lo + 1] - target)
+
+    lower = quantity - user_traded
+    upper = np.minimum(quantity, others)
+    with_user = user_traded_value.sum(axis=1)[:, None] - user_traded_value
+    fees = np.where(upper > lower, np.abs(without - with_user), 0.)
+    return fees, trading
+
+
+def _clear_side_arrays(q_buy, p_buy, q_sell, p_sell, u_buy, u_sell,
+                       price, id_buy, id_sell):
+    """Array implementation of `solve_market_side_with_exogenous_price`
+    for one market given as arrays sorted by price. Returns the quantity
+    traded, the bid and quantity of each transaction, and the users
+    of the long side that trade together with their fees."""
+    no_trade = (0, id_buy[:0], q_buy[:0], u_buy[:0], np.zeros(0))
+    if q_buy.shape[0] == 0 or q_sell.shape[0] == 0:
+        return no_trade
+    n_buy = np.searchsorted(-p_buy, -price, side='right')
+    n_sell = np.searchsorted(p_sell, price, side='right')
+    demand = (q_buy[:n_buy], p_buy[:n_buy], u_buy[:n_buy], id_buy[:n_buy])
+    supply = (q_sell[:n_sell], p_sell[:n_sell], u_sell[:n_sell],
+              id_sell[:n_sell])
+    supply_quantity = supply[0].sum()
+    demand_quantity = demand[0].sum()
+
+    supply_long = supply_quantity > demand_quantity
+    long_side = supply if supply_long else demand
+    short_side = demand if supply_long else supply
+    total_quantity = demand_quantity if supply_long else supply_quantity
+    if not total_quantity > 0:
+        return no_trade
+
+    bids, traded = [], []
+    for q, _, _, ids in [short_side, long_side]:
+        index, partial = get_trading_cut(q, total_quantity)
+        trading = q[:index + 1]
+        if partial < trading[-1]:
+            trading = trading.astype('float64')
+            trading[-1] = partial
+        bids.append(ids[:index + 1])
+        traded.append(trading)
+
+    q, p, u, _ = long_side
+    trading = pd.unique(u[:index + 1])
+    q, p, u = _split_cut(index, partial, q, p, u)
+    user_fees = _long_side_fees(
+        q, p, u, index, total_quantity, price, trading)
+    return total_quantity, np.concatenate(bids), np.concatenate(traded), \
+        trading, user_fees
+
+
+def muda_monte_carlo(bids, n_draws, r=None, batch_size=None,
+                     memory_budget=1 << 27):
+    """Runs the MUDA mechanism on many random partitions
+    of the same bids.
+
+    The bids are validated, sorted and grouped by user once. The
+    partitions are drawn in blocks of `batch_size` and each block is
+    processed with operations on `(batch_size, N)` matrices, with `N`
+    the number of bids: the competitive prices of the left and right
+    markets are read from the cumulative quantities of the bids
+    selected in each partition, and the fees of the long side of every
+    market that trades are found with a single binary search.
+
+    The random numbers are drawn in the same order as `muda`, so
+    the draw `i` is the same as the `i`-th of `n_draws` consecutive
+    calls to `muda` with the same random state. Players in the same side
+    with the same price are ordered by their position in `bids`.
+
+    Parameters
+    ----------
+    bids: pd.DataFrame or OrderedDict
+        Collection of bids to be used in the market, as a
+        dataframe or as the arrays of `BidManager.get_arrays`
+    n_draws: int
+        Number of random partitions
+    r: np.random.RandomState
+        A numpy random state generator. If not given,
+        a new one will be created and the output will
+        be random.
+    batch_size: int or None
+        Number of partitions processed together. If None, it is
+        the largest one whose temporary matrices, about
+        `_BYTES_PER_DRAW_AND_BID` bytes per partition and bid,
+        fit in `memory_budget`.
+    memory_budget: int
+        Number of bytes used to derive `batch_size`.
+
+    Returns
+    -------
+    results: OrderedDict
+        Keys:
+        * price_left: clearing price of the left market of each draw
+        * price_right: clearing price of the right market of each draw
+        * quantity_left: quantity traded in the left market of each draw
+        * quantity_right: quantity traded in the right market of each draw
+        * fees: matrix with the fees paid by each player in each draw
 
-    buy, _ = demand_curve_from_bids(bids)
-    sell, _ = supply_curve_from_bids(bids)
+    Examples
+    ---------
 
-    q_, b_, s_, price = intersect_stepwise(buy, sell)
+    >>> bm = pm.BidManager()
+    >>> bm.add_bids([1, 1, 1], [4, 2, 5], [0, 1, 4])
+    range(0, 3)
+    >>> bm.add_bids([1, 1], [3, 1], [2, 3], False)
+    range(3, 5)
+    >>> r = np.random.RandomState(69)
+    >>> results = muda_monte_carlo(bm.get_df(), 3, r)
+    >>> results['price_left']
+    array([1.5, inf, 2.5])
+    >>> results['quantity_left'] + results['quantity_right']
+    array([0., 0., 1.])
+    """
+    validate_equal_price(bids)
+    if r is None:
+        r = np.random.RandomState()
 
-    return price
+    columns, index = bid_arrays(bids)
+    n_bids = index.shape[0]
+    quantity = np.asarray(columns['quantity']).astype('float64')
+    price = np.asarray(columns['price']).astype('float64')
+    buying = np.asarray(columns['buying'], dtype=bool)
+    user = np.asarray(columns['user']).astype('int64')
+
+    buyers, sellers = _sorted_sides(price, buying)
+    q_buy, p_buy = quantity[buyers], price[buyers]
+    q_sell, p_sell = quantity[sellers], price[sellers]
+    cheaper = np.searchsorted(p_sell, p_buy, side='left')
+    dearer = np.searchsorted(-p_buy, -p_sell, side='left')
+    groups = (_user_segments(user[buyers]), _user_segments(user[sellers]))
+
+    price_left = np.empty(n_draws)
+    price_right = np.empty(n_draws)
+    quantity_left = np.zeros(n_draws)
+    quantity_right = np.zeros(n_draws)
+    fees = np.zeros((n_draws, pd.unique(user).shape[0]))
+    if batch_size is None:
+        batch_size = max(
+            1, memory_budget // (max(n_bids, 1) * _BYTES_PER_DRAW_AND_BID))
+
+    for start in range(0, n_draws, batch_size):
+        stop = min(start + batch_size, n_draws)
+        left = r.rand(stop - start, n_bids) > 0.5
+        prices = [
+            _batch_competitive_prices(
+                market[:, buyers], market[:, sellers], q_buy, p_buy,
+                q_sell, p_sell, cheaper, dearer)
+            for market in [left, ~left]]
+        price_left[start:stop], price_right[start:stop] = prices
+
+        # Each market clears at the price of the other one
+        clearing = [(left, prices[1], quantity_left),
+                    (~left, prices[0], quantity_right)]
+        for market, other_price, traded in clearing:
+            demand = market[:, buyers] & (p_buy >= other_price[:, None])
+            supply = market[:, sellers] & (p_sell <= other_price[:, None])
+            # Summed in order, as the sides are in `muda`
+            demand_quantity = _masked_cumsum(demand, q_buy)[:, -1]
+            supply_quantity = _masked_cumsum(supply, q_sell)[:, -1]
+            traded[start:stop] = np.minimum(demand_quantity, supply_quantity)
+
+            supply_long = supply_quantity > demand_quantity
+            trade = traded[start:stop] > 0
+            long_sides = [
+                (trade & ~supply_long, demand, q_buy, p_buy, groups[0]),
+                (trade & supply_long, supply, q_sell, p_sell, groups[1])]
+            for rows, side, q, p, side_groups in long_sides:
+                rows = np.flatnonzero(rows)
+                if rows.shape[0] == 0:
+                    continue
+                user_fees, trading = _batch_fees(
+                    side[rows], q, p, other_price[rows],
+                    traded[start + rows], side_groups)
+                row, column = np.nonzero(trading)
+                fees[start + rows[row], side_groups[0][column]] = \
+                    user_fees[row, column]
+
+    results = OrderedDict([
+        ('price_left', price_left),
+        ('price_right', price_right),
+        ('quantity_left', quantity_left),
+        ('quantity_right', quantity_right),
+        ('fees', fees)])
+    return results
 
 
 class MudaAuction(Mechanism):
@@ -440,6 +999,8 @@ class MudaAuction(Mechanism):
         with.
     """
 
+    accepts_arrays = True
+
     def __init__(self, bids, *args, **kwargs):
         """TODO: to be defined1. """
         Mechanism.__init__(self, muda, bids, *args, **kwargs)
@@ -71,8 +71,10 @@ def p2p_random(bids, p_coef=0.5, r=None):
     """
     r = np.random.RandomState() if r is None else r
     trans = TransactionManager()
-    buying = bids[bids.buying]
-    selling = bids[bids.buying == False]
+    # Work with positions and report the bid identifiers (index)
+    bid_ids = bids.index.tolist()
+    buying = np.flatnonzero(bids.buying.values == True)
+    selling = np.flatnonzero(bids.buying.values == False)
     Nb, Ns = buying.shape[0], selling.shape[0]
 
     quantities = bids.quantity.values.copy()
@@ -85,8 +87,8 @@ def p2p_random(bids, p_coef=0.5, r=None):
     pairs = np.ones((Nb + Ns, Nb * Ns), dtype=bool)
     pairs_inv = []
     i = 0
-    for b in buying.index:
-        for s in selling.index:
+    for b in buying:
+        for s in selling:
             pairs[b, i] = False  # Row b has 0s whenever the pair involves b
             pairs[s, i] = False  # Same for s
             pairs_inv.append((b, s))
@@ -108,23 +110,25 @@ def p2p_random(bids, p_coef=0.5, r=None):
             tmp_active &= pairs[trade[0], :]  # buyer and seller already used
             tmp_active &= pairs[trade[1], :]
 
-        general_trading_list.append(trading_list)
+        general_trading_list.append(
+            [(bid_ids[b], bid_ids[s]) for (b, s) in trading_list])
         for (b, s) in trading_list:
+            id_b, id_s = bid_ids[b], bid_ids[s]
             if prices[b] >= prices[s]:
                 q = min(quantities[b], quantities[s])
                 p = prices[b] * p_coef + (1 - p_coef) * prices[s]
-                trans_b = (b, q, p, s, (quantities[b] - q) > 0)
-                trans_s = (s, q, p, b, (quantities[s] - q) > 0)
+                trans_b = (id_b, q, p, id_s, (quantities[b] - q) > 0)
+                trans_s = (id_s, q, p, id_b, (quantities[s] - q) > 0)
                 quantities[b] -= q
                 quantities[s] -= q
             else:
-                trans_b = (b, 0, 0, s, True)
-                trans_s = (s, 0, 0, b, True)
+                trans_b = (id_b, 0, 0, id_s, True)
+                trans_s = (id_s, 0, 0, id_b, True)
             trans.add_transaction(*trans_b)
             trans.add_transaction(*trans_s)
 
-        inactive_buying = [b for b in buying.index if quantities[b] == 0]
-        inactive_selling = [s for s in selling.index if quantities[s] == 0]
+        inactive_buying = [b for b in buying if quantities[b] == 0]
+        inactive_selling = [s for s in selling if quantities[s] == 0]
 
         tmp_active = active.copy()
         for inactive in inactive_buying + inactive_selling:
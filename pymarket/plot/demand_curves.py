@@ -4,10 +4,10 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 
-from pymarket.bids.demand_curves import demand_curve_from_bids, supply_curve_from_bids
+from pymarket.bids.step_curve import StepCurve
 
 
-def plot_demand_curves(bids, ax=None, margin_X=1.2, margin_Y=1.2):
+def plot_demand_curves(bids, ax=None, margin_X=1.2, margin_Y=1.2, curves=None):
     """Plots the demand curves.
     If ax is none, creates a new figure
 
@@ -22,6 +22,9 @@ def plot_demand_curves(bids, ax=None, margin_X=1.2, margin_Y=1.2):
          (Default value = 1.2)
     margin_Y :
          (Default value = 1.2)
+    curves : tuple of StepCurve, optional
+         Demand and supply curves of `bids`, if they were
+         already built. (Default value = None)
 
     Returns
     -------
@@ -35,14 +38,17 @@ def plot_demand_curves(bids, ax=None, margin_X=1.2, margin_Y=1.2):
     extra_X = 3
     extra_Y = 1
 
-    dc = demand_curve_from_bids(bids)[0]
-    sp = supply_curve_from_bids(bids)[0]
+    if curves is None:
+        curves = (StepCurve.from_bids(bids, buying=True),
+                  StepCurve.from_bids(bids, buying=False))
+    dc = curves[0].to_array()
+    sp = curves[1].to_array()
 
     x_dc = dc[:, 0]
     x_dc = np.concatenate([[0], x_dc])
     x_sp = np.concatenate([[0], sp[:, 0]])
 
-    y_sp = sp[:, 1]
+    y_sp = sp[:, 1].copy()
     y_dc = dc[:, 1]
     max_x = max(x_dc[-2], x_sp[-2])
     extra_X = max_x * margin_X
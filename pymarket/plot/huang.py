@@ -3,6 +3,7 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 from pymarket.plot.demand_curves import plot_demand_curves
+from pymarket.bids.step_curve import StepCurve
 
 
 def plot_huang_auction(bids, price_sell, price_buy, quantity_traded, ax=None):
@@ -11,8 +12,9 @@ def plot_huang_auction(bids, price_sell, price_buy, quantity_traded, ax=None):
 
     Parameters
     ----------
-    bids (pandas dataframe):
-        Table with all the bids submitted
+    bids (BidManager):
+        Manager with all the bids submitted. Its curves
+        are kept in `curve_cache` until the bids change.
     price_sell (list):
         The price at which all sellers sell
     price_buy (list):
@@ -27,10 +29,11 @@ def plot_huang_auction(bids, price_sell, price_buy, quantity_traded, ax=None):
 
 
     """
-    bids = bids.get_df()
+    curves = tuple(
+        StepCurve.from_manager(bids, buying) for buying in [True, False])
     if ax is None:
         fig, ax = plt.subplots(figsize=(8, 8))
-    plot_demand_curves(bids, ax=ax)
+    plot_demand_curves(bids.get_df(), ax=ax, curves=curves)
     ax.axhline(price_sell, linestyle='--', c='k', label='Sell price')
     ax.axhline(price_buy, linestyle='-.', c='k', label='Buy price')
     ax.axvline(quantity_traded, linestyle='--', c='k', label='Quantity traded')
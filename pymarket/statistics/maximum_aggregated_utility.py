@@ -88,10 +88,10 @@ def maximum_aggregated_utility(bids, *args, reservation_prices=None):
     model += pulp.lpSum([qs[x[0], x[1]] * coeffs[x] for x in index])
 
     for b in buyers:
-        model += pulp.lpSum(qs[b, j] for j in sellers) <= bids.iloc[b, 0]
+        model += pulp.lpSum(qs[b, j] for j in sellers) <= bids.loc[b, 'quantity']
 
     for s in sellers:
-        model += pulp.lpSum(qs[i, s] for i in buyers) <= bids.iloc[s, 0]
+        model += pulp.lpSum(qs[i, s] for i in buyers) <= bids.loc[s, 'quantity']
 
     model.solve()
 
@@ -52,7 +52,7 @@ def maximum_traded_volume(bids, *args, reservation_prices=OrderedDict()):
     sellers = bids.loc[~bids['buying']].index.values
 
     index = [(i, j) for i in buyers for j in sellers
-             if bids.iloc[i, 1] >= bids.iloc[j, 1]]
+             if bids.loc[i, 'price'] >= bids.loc[j, 'price']]
 
     qs = pulp.LpVariable.dicts('q', index, lowBound=0, cat='Continuous')
 
@@ -60,11 +60,11 @@ def maximum_traded_volume(bids, *args, reservation_prices=OrderedDict()):
 
     for b in buyers:
         model += pulp.lpSum(qs[b, j]
-                            for j in sellers if (b, j) in index) <= bids.iloc[b, 0]
+                            for j in sellers if (b, j) in index) <= bids.loc[b, 'quantity']
 
     for s in sellers:
         model += pulp.lpSum(qs[i, s]
-                            for i in buyers if (i, s) in index) <= bids.iloc[s, 0]
+                            for i in buyers if (i, s) in index) <= bids.loc[s, 'quantity']
 
     model.solve()
 
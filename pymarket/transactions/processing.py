@@ -2,9 +2,69 @@
 Some processing functions to deal with transactions
 """
 
+import numpy as np
 import pandas as pd
 
 from pymarket.transactions.transactions import TransactionManager
+from pymarket.utils.columns import bid_arrays
+
+
+def maping_to_csr(maping):
+    """
+    Converts a maping from merged bids to original bids into
+    a flat (CSR-like) representation.
+
+    Parameters
+    ----------
+    maping : dict
+        Maping from each merged bid to the list of original
+        bids it contains.
+
+    Returns
+    -------
+    keys : np.ndarray
+        Identifiers of the merged bids, sorted increasingly.
+    offsets : np.ndarray
+        The original bids of `keys[i]` are
+        `bid_ids[offsets[i]: offsets[i + 1]]`.
+    bid_ids : np.ndarray
+        Identifiers of the original bids, grouped by merged bid.
+
+    Examples
+    ---------
+    >>> keys, offsets, bid_ids = maping_to_csr({0: [0, 1], 1: [2], 2: [3, 4]})
+    >>> offsets
+    array([0, 2, 3, 5])
+    >>> bid_ids
+    array([0, 1, 2, 3, 4])
+    """
+    keys = np.array(sorted(maping.keys()), dtype='int64')
+    lists = [maping[k] for k in keys]
+    lengths = np.array([len(x) for x in lists], dtype='int64')
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype('int64')
+    if len(lists) > 0:
+        bid_ids = np.concatenate(lists).astype('int64')
+    else:
+        bid_ids = np.zeros(0, dtype='int64')
+    return keys, offsets, bid_ids
+
+
+def _merged_groups(keys, n_groups, merged):
+    """Position of each merged bid in the flat representation
+    of the maping, raising a KeyError for unknown bids."""
+    merged = np.asarray(merged, dtype='int64')
+    if keys is None:
+        group = merged
+        found = (group >= 0) & (group < n_groups)
+    else:
+        group = np.searchsorted(keys, merged)
+        found = group < keys.shape[0]
+        found[found] = keys[group[found]] == merged[found]
+    if not found.all():
+        raise KeyError(
+            'Merged bids {} are not in the maping'.format(
+                merged[~found].tolist()))
+    return group
 
 
 def split_transactions_merged_players(transactions, bids, maping, fees=None):
@@ -14,23 +74,43 @@ def split_transactions_merged_players(transactions, bids, maping, fees=None):
     Uses a proportional split, based on the offered (or asked) quantity by
     each player.
 
+    All the transactions are split at once: each transaction is repeated
+    once for each original bid of its merged bid and its quantity is
+    multiplied by the share of that bid in the merged quantity.
+
     Parameters
     ----------
     transactions: TransactionManager
         the transactions manager returned by the mechanism.
-    bids: pandas dataframe
-        the original bid dataframe where some players might be repeated
-    maping: pandas dataframe
+    bids: pandas dataframe or OrderedDict
+        the original bid dataframe where some players might be repeated,
+        or its arrays as returned by `BidManager.get_arrays`
+    maping: dict or tuple
         A maping between the bids in the transaction dataframe and the original
-        bids.
+        bids. Either a dictionary from each merged bid to the list of
+        its original bids, or the tuple `(offsets, bid_ids)` where
+        the original bids of merged bid `i` are
+        `bid_ids[offsets[i]: offsets[i + 1]]`.
+    fees: dict or None
+        Maping from merged bids to the fee they have to pay. The fee
+        of each merged bid is split among the users of its original
+        bids, proportionally to their quantities.
+
+    Raises
+    ------
+    KeyError
+        If a merged bid of the transactions or of `fees` is not
+        in the maping, or an original bid is not in `bids`.
 
     Returns
     --------
     transactions_splited: pandas dataframe
         the result of splitting each merged bid in the transactions
         dataframe
-    fees: dict or None
-        dictionary obtained by splitting the fees equal to the transactions
+    user_fees: dict
+        Maping from each user to the fee it has to pay, only returned
+        if `fees` is not None. A user with several original bids pays
+        the sum of their shares.
 
     Examples
     -----------
@@ -49,31 +129,60 @@ def split_transactions_merged_players(transactions, bids, maping, fees=None):
     1    1  0.666667      1      -1   False
 
     """
+    if isinstance(maping, dict):
+        keys, offsets, bid_ids = maping_to_csr(maping)
+    else:
+        offsets, bid_ids = (np.asarray(x, dtype='int64') for x in maping)
+        keys = None
+
+    # Share of each original bid in its merged bid
+    columns, index = bid_arrays(bids)
+    position = pd.Index(index).get_indexer(bid_ids)
+    if np.any(position < 0):
+        raise KeyError('Bids {} are not in the collection of bids'.format(
+            bid_ids[position < 0].tolist()))
+    quantity = np.asarray(columns['quantity'])[position].astype('float64')
+    lengths = np.diff(offsets)
+    flat_group = np.repeat(np.arange(lengths.shape[0]), lengths)
+    totals = np.bincount(
+        flat_group, weights=quantity, minlength=lengths.shape[0])
+    share = quantity / totals[flat_group]
 
     trans = TransactionManager()
-    new_rows = []
-    for i, t in transactions.get_df().iterrows():
-        rows = maping[t.bid]
-        if True:  # TODO make more options available
-            perc = bids.iloc[rows, :] / bids.iloc[rows, :].quantity.sum()
-            perc = perc.quantity
-        if len(rows) > 1 and fees is not None:
-            fee = fees.pop(t.user, None)
-        for r in rows:
-            #t_ = pd.DataFrame(t).copy().T
-            # print(r)
-            t_ = t.copy().values
-            # print(t_)
-            t_[0] = r
-            t_[1] *= perc[r]
-            if len(rows) > 1 and fees is not None and fee is not None:
-                fees[bids.iloc[r, :].user] = fee * perc[r]
-            #t_.iloc[0, 0] = r
-            #t_.iloc[0, 1] *= perc[r]
-            # new_rows.append(t_)
-            trans.add_transaction(*t_)
-    #transactions_splited = pd.concat(new_rows)
-    if fees is not None:
-        return trans, fees
-    else:
+    df = transactions.get_df()
+    if df.shape[0] > 0:
+        # Repeat each transaction once for each of its original bids
+        merged = df.bid.values
+        group = _merged_groups(keys, lengths.shape[0], merged)
+        counts = lengths[group]
+        rows = np.repeat(np.arange(df.shape[0]), counts)
+        first = np.repeat(offsets[group], counts)
+        within = np.arange(rows.shape[0]) - np.repeat(
+            np.cumsum(counts) - counts, counts)
+        flat = first + within
+
+        trans.add_transactions(
+            bid_ids[flat],
+            df.quantity.values[rows] * share[flat],
+            df.price.values[rows],
+            df.source.values[rows],
+            df.active.values[rows])
+
+    if fees is None:
         return trans
+
+    # Fee of each merged bid, then the share of each original bid,
+    # summed by user
+    merged = np.fromiter(fees.keys(), dtype='int64', count=len(fees))
+    paid = np.fromiter(fees.values(), dtype='float64', count=len(fees))
+    group = _merged_groups(keys, lengths.shape[0], merged)
+    group_fee = np.bincount(group, weights=paid, minlength=lengths.shape[0])
+    charged = np.bincount(group, minlength=lengths.shape[0])[flat_group] > 0
+    users = np.asarray(columns['user'])[position][charged]
+    users, inverse = np.unique(users, return_inverse=True)
+    amount = np.bincount(
+        inverse,
+        weights=(group_fee[flat_group] * share)[charged],
+        minlength=users.shape[0])
+    user_fees = dict(zip(users.tolist(), amount.tolist()))
+    return trans, user_fees
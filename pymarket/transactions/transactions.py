@@ -1,5 +1,8 @@
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
+
+from pymarket.utils.columns import ColumnStore
 
 
 class TransactionManager:
@@ -9,6 +12,12 @@ class TransactionManager:
     Transactions are the minimal unit to represent
     the outcome of a market.
 
+    Transactions are stored column-wise in numpy arrays.
+    A manager obtained from `merge` keeps references to the
+    arrays of the merged managers (chunks) instead of copying
+    them, and they are only concatenated, once, when the dataframe
+    is first created.
+
     Attributes
     -----------
     name_col: list of str
@@ -17,7 +26,8 @@ class TransactionManager:
     n_trans: int
         Number of transactions currently in the Manager
     trans: list of tuples
-        List of the actual transactions available
+        List of the actual transactions available. It is
+        built from the stored arrays on each access.
     """
 
     name_col = ['bid', 'quantity', 'price', 'source', 'active']
@@ -26,7 +36,21 @@ class TransactionManager:
         """
         """
         self.n_trans = 0
-        self.trans = []
+        self._chunks = []
+        self._store = ColumnStore(self.name_col)
+
+    @property
+    def trans(self):
+        return [t for chunk in self._all_chunks() for t in zip(
+            *[chunk[c].tolist() for c in self.name_col])]
+
+    def _all_chunks(self):
+        """Columns of the merged managers followed by
+        the columns of the transactions added to this one."""
+        chunks = list(self._chunks)
+        if len(self._store) > 0:
+            chunks.append(self._store.views())
+        return chunks
 
     def add_transaction(self, bid, quantity, price, source, active):
         """Add a transaction to the transactions list
@@ -65,13 +89,67 @@ class TransactionManager:
         """
 
         new_trans = (bid, quantity, price, source, active)
-        self.trans.append(new_trans)
+        self._store.append(new_trans)
         self.n_trans += 1
 
         return self.n_trans - 1
 
+    def add_transactions(self, bids, quantities, prices, sources, active):
+        """Adds many transactions at once
+
+        Parameters
+        ----------
+        bids : np.ndarray
+            Unique identifier of the bid of each transaction
+        quantities : np.ndarray or float
+            Transacted quantities
+        prices : np.ndarray or float
+            Transacted prices
+        sources : np.ndarray or int
+            Identifier of the second party in each trasaction,
+            -1 if there is no clear second party.
+        active : np.ndarray or bool
+            `True` if the bid is still active after the
+            transaction.
+
+        Scalars are used for all the transactions.
+
+        Returns
+        --------
+        range
+            ids of the added transactions
+
+        Examples
+        ---------
+
+        >>> tm = pm.TransactionManager()
+        >>> tm.add_transactions([3, 1], [1, 0.5], 2.5, -1, False)
+        range(0, 2)
+        >>> tm.get_df()
+           bid  quantity  price  source  active
+        0    3       1.0    2.5      -1   False
+        1    1       0.5    2.5      -1   False
+        """
+        values = [np.asarray(v) for v in
+                  [bids, quantities, prices, sources, active]]
+        lengths = set(v.shape[0] for v in values if v.ndim > 0)
+        if len(lengths) > 1:
+            raise ValueError(
+                'All the transaction attributes must have the same length, '
+                'got lengths {}'.format(sorted(lengths)))
+        n = lengths.pop() if lengths else 1
+        values = [np.broadcast_to(v, (n,)) if v.ndim == 0 else v
+                  for v in values]
+        first_id = self.n_trans
+        self._store.extend(values)
+        self.n_trans += n
+        return range(first_id, self.n_trans)
+
     def get_df(self):
-        """Returns the transaction dataframe
+        """Returns the transaction dataframe.
+        The columns of the dataframe are read-only views of
+        the stored arrays, so no data is copied. Take a copy
+        of the dataframe to modify it.
 
         Parameters
         ----------
@@ -94,16 +172,35 @@ class TransactionManager:
         0    1       0.5    2.1      -1   False
         1    5       0.0    0.0       3    True
         """
-
-        df = pd.DataFrame(self.trans, columns=self.name_col)
-        return df
+        if self.n_trans == 0:
+            columns = OrderedDict((c, np.zeros(0)) for c in self.name_col)
+        else:
+            columns = self._columns()
+        for values in columns.values():
+            values.flags.writeable = False
+        index = pd.RangeIndex(0, self.n_trans)
+        return pd.DataFrame(
+            columns, columns=self.name_col, index=index, copy=False)
+
+    def _columns(self):
+        """Views of the columns of all the transactions. The chunks
+        of merged managers are first copied into the own store, so
+        that they are concatenated only once."""
+        if len(self._chunks) > 0:
+            store = ColumnStore(self.name_col)
+            for chunk in self._all_chunks():
+                store.extend([chunk[c] for c in self.name_col])
+            self._store = store
+            self._chunks = []
+        return self._store.views()
 
     def merge(self, other):
         """
         Merges two transaction managers with each other
         There are no checks on whether the new
         TransactionManger is consisten after the
-        merge.
+        merge. The transactions are not copied, the
+        new manager references the arrays of both.
 
         Parameters
         ----------
@@ -136,9 +233,7 @@ class TransactionManager:
         assert isinstance(other, TransactionManager)
 
         trans = TransactionManager()
-        for t in self.trans:
-            trans.add_transaction(*t)
-        for t in other.trans:
-            trans.add_transaction(*t)
+        trans._chunks = self._all_chunks() + other._all_chunks()
+        trans.n_trans = self.n_trans + other.n_trans
 
         return trans
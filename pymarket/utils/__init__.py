@@ -3,6 +3,8 @@
 """Top-level package for pymarket."""
 
 from pymarket.utils.decorators import *
+from pymarket.utils.columns import *
+from pymarket.utils.cache import *
 
 __author__ = """Diego Kiedanki"""
 __email__ = 'gusok@protonmail.com'
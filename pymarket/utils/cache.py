@@ -0,0 +1,123 @@
+"""
+Fingerprints of collections of arrays and a small, thread safe,
+least recently used cache keyed by them.
+"""
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+__all__ = ['LRUCache', 'fingerprint']
+
+
+def fingerprint(*arrays):
+    """Hash of the content of some arrays
+
+    Parameters
+    ----------
+    *arrays : np.ndarray
+        Arrays to hash, in order.
+
+    Returns
+    -------
+    str
+        Blake2b digest of the hashed values of every array.
+
+    Examples
+    ---------
+    >>> fingerprint(np.array([1, 2])) == fingerprint(np.array([1, 2]))
+    True
+    >>> fingerprint(np.array([1, 2])) == fingerprint(np.array([2, 1]))
+    False
+    """
+    digest = hashlib.blake2b()
+    for values in arrays:
+        digest.update(pd.util.hash_array(np.asarray(values)).tobytes())
+    return digest.hexdigest()
+
+
+class LRUCache(object):
+    """Least recently used cache that can be shared
+    between threads.
+
+    Parameters
+    ----------
+    maxsize : int
+        Maximum number of values to keep.
+
+    Attributes
+    -----------
+    hits : int
+        Number of values found in the cache.
+    misses : int
+        Number of values that were not found.
+
+    Examples
+    ---------
+    >>> cache = LRUCache(maxsize=1)
+    >>> cache.put('a', 1)
+    >>> cache.get('a'), cache.get('b')
+    (1, None)
+    >>> cache.put('b', 2)
+    >>> cache.get('a'), len(cache)
+    (None, 1)
+    >>> cache.hits, cache.misses
+    (1, 2)
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._values)
+
+    def get(self, key):
+        """Value stored with `key`, marked as
+        the most recently used one
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the value.
+
+        Returns
+        -------
+        object or None
+            The value, or None if it is not in the cache.
+        """
+        with self._lock:
+            if key in self._values:
+                self._values.move_to_end(key)
+                self.hits += 1
+                return self._values[key]
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """Stores a value, evicting the least recently
+        used ones if the cache is full
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the value.
+        value : object
+            Value to store, can not be None.
+        """
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def clear(self):
+        """Removes all the values and resets the counters"""
+        with self._lock:
+            self._values.clear()
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,516 @@
+"""
+Growable, typed and column oriented storage used by the
+managers to keep their records as numpy arrays.
+"""
+import os
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+
+__all__ = ['ColumnStore', 'MemmapColumnStore', 'bid_arrays', 'bid_positions']
+
+_PYTHON_DTYPES = {
+    bool: np.dtype(bool),
+    int: np.dtype('int64'),
+    float: np.dtype('float64'),
+}
+
+_NUMERIC_KINDS = 'biufc'
+
+
+def infer_dtype(value):
+    """Finds the dtype that a column needs to store `value`
+
+    Parameters
+    ----------
+    value : scalar
+        Value to be stored.
+
+    Returns
+    -------
+    dtype : np.dtype
+        The dtype that pandas would have used for
+        a column made only of `value`.
+
+    Examples
+    ---------
+    >>> infer_dtype(1)
+    dtype('int64')
+    >>> infer_dtype(True)
+    dtype('bool')
+    >>> infer_dtype(np.float32(1.5))
+    dtype('float32')
+    """
+    dtype = _PYTHON_DTYPES.get(type(value))
+    if dtype is None:
+        dtype = np.asarray(value).dtype
+    return dtype
+
+
+def promote_dtype(old, new):
+    """Finds the smallest dtype able to store values of
+    both `old` and `new`, falling back to `object`
+    for non numeric types.
+
+    Parameters
+    ----------
+    old : np.dtype
+        Current dtype of the column
+    new : np.dtype
+        Dtype of the incoming values
+
+    Returns
+    -------
+    dtype : np.dtype
+        Dtype of the column after storing the new values.
+
+    Examples
+    ---------
+    >>> promote_dtype(np.dtype(bool), np.dtype('int64'))
+    dtype('int64')
+    >>> promote_dtype(np.dtype('int64'), np.dtype('float64'))
+    dtype('float64')
+    >>> promote_dtype(np.dtype('int64'), np.dtype('<U3'))
+    dtype('O')
+    """
+    if old.kind in _NUMERIC_KINDS and new.kind in _NUMERIC_KINDS:
+        return np.promote_types(old, new)
+    if old == new:
+        return old
+    return np.dtype(object)
+
+
+class ColumnStore(object):
+    """Stores a table as one numpy array per column.
+
+    Arrays are over-allocated and their capacity is doubled
+    each time they get full, so appending a row has an amortized
+    constant cost. The dtype of each column is taken from the
+    first row stored and is promoted (for example from `int64` to
+    `float64`) if a later value requires it, so that the resulting
+    dataframe has the same dtypes as one built from a list of tuples.
+
+    Parameters
+    ----------
+    names : list of str
+        Name of the columns, in order.
+    capacity : int
+        Number of rows to preallocate.
+
+    Attributes
+    -----------
+    names : list of str
+        Name of the columns, in order.
+    size : int
+        Number of rows currently stored.
+    capacity : int
+        Number of rows that fit in the allocated arrays.
+    columns : OrderedDict
+        Maping from column name to the underlying array. Only
+        the first `size` elements are meaningful.
+    chunk_size : int
+        Number of rows moved at once by `compact`.
+
+    Examples
+    ---------
+    >>> cs = ColumnStore(['a', 'b'])
+    >>> cs.append((1, True))
+    0
+    >>> cs.append((2.5, False))
+    1
+    >>> cs.view('a')
+    array([1. , 2.5])
+    >>> cs.capacity
+    16
+    >>> cs.rows()
+    [(1.0, True), (2.5, False)]
+    """
+
+    min_capacity = 16
+    chunk_size = 1 << 20
+
+    def __init__(self, names, capacity=0):
+        self.names = list(names)
+        self.size = 0
+        self.capacity = capacity
+        self.columns = OrderedDict(
+            (name, np.empty(capacity, dtype=object)) for name in self.names)
+
+    def __len__(self):
+        return self.size
+
+    def reserve(self, n):
+        """Makes sure that at least `n` rows fit in the
+        allocated arrays, at least doubling the capacity
+        when the arrays have to grow.
+
+        Parameters
+        ----------
+        n : int
+            Number of rows that have to fit.
+
+        Returns
+        -------
+        """
+        if n <= self.capacity:
+            return
+        capacity = max(n, 2 * self.capacity, self.min_capacity)
+        for name, col in self.columns.items():
+            new_col = np.empty(capacity, dtype=col.dtype)
+            new_col[: self.size] = col[: self.size]
+            self.columns[name] = new_col
+        self.capacity = capacity
+
+    def _ensure_dtype(self, name, dtype):
+        """Promotes the column `name` so that it can hold
+        values of type `dtype`. An empty store adopts `dtype`."""
+        col = self.columns[name]
+        if self.size == 0:
+            new_dtype = dtype
+        else:
+            new_dtype = promote_dtype(col.dtype, dtype)
+        if new_dtype != col.dtype:
+            new_col = np.empty(self.capacity, dtype=new_dtype)
+            new_col[: self.size] = col[: self.size]
+            self.columns[name] = new_col
+        return self.columns[name]
+
+    def append(self, row):
+        """Appends a new row at the end of the store
+
+        Parameters
+        ----------
+        row : tuple
+            Values of the row, in the same order as `names`.
+
+        Returns
+        -------
+        int
+            Position of the new row.
+        """
+        i = self.size
+        self.reserve(i + 1)
+        for name, value in zip(self.names, row):
+            col = self.columns[name]
+            dtype = infer_dtype(value)
+            if dtype != col.dtype:
+                col = self._ensure_dtype(name, dtype)
+            col[i] = value
+        self.size += 1
+        return i
+
+    def extend(self, values):
+        """Appends many rows at once at the end of the store
+
+        Parameters
+        ----------
+        values : list of np.ndarray
+            One array for each column, in the same order as `names`.
+            All arrays should have the same length.
+
+        Returns
+        -------
+        start : int
+            Position of the first new row.
+        stop : int
+            Position after the last new row.
+
+        Examples
+        ---------
+        >>> cs = ColumnStore(['a', 'b'])
+        >>> cs.extend([np.array([1, 2]), np.array([True, False])])
+        (0, 2)
+        >>> cs.extend([np.array([0.5]), np.array([True])])
+        (2, 3)
+        >>> cs.view('a')
+        array([1. , 2. , 0.5])
+        """
+        values = [np.asarray(v) for v in values]
+        start = self.size
+        n = values[0].shape[0] if len(values) > 0 else 0
+        if n == 0:
+            return start, start
+        self.reserve(start + n)
+        for name, v in zip(self.names, values):
+            col = self.columns[name]
+            if v.dtype != col.dtype:
+                col = self._ensure_dtype(name, v.dtype)
+            col[start: start + n] = v
+        self.size += n
+        return start, self.size
+
+    def set(self, i, name, value):
+        """Overwrites a single value, promoting the column
+        if needed.
+
+        Parameters
+        ----------
+        i : int
+            Position of the row
+        name : str
+            Name of the column
+        value : scalar
+            New value
+        """
+        col = self.columns[name]
+        dtype = infer_dtype(value)
+        if dtype != col.dtype:
+            col = self._ensure_dtype(name, dtype)
+        col[i] = value
+
+    def compact(self, keep):
+        """Removes rows in place, keeping the order
+        of the remaining ones. The capacity is not changed.
+        The rows are moved in chunks of `chunk_size`, so only
+        one chunk of each column is loaded in memory at a time.
+
+        Parameters
+        ----------
+        keep : np.ndarray
+            Boolean mask of length `size`, `True` for the
+            rows that remain in the store.
+
+        Examples
+        ---------
+        >>> cs = ColumnStore(['a'])
+        >>> cs.extend([np.array([1, 2, 3])])
+        (0, 3)
+        >>> cs.compact(np.array([True, False, True]))
+        >>> cs.view('a')
+        array([1, 3])
+        """
+        n = 0
+        for start in range(0, self.size, self.chunk_size):
+            stop = min(start + self.chunk_size, self.size)
+            chunk = np.array(keep[start: stop], dtype=bool)
+            m = int(np.count_nonzero(chunk))
+            for name in self.names:
+                col = self.columns[name]
+                col[n: n + m] = col[start: stop][chunk]
+            n += m
+        self.size = n
+
+    def flush(self):
+        """Writes pending changes to disk.
+        Nothing to do for stores kept in memory."""
+
+    def close(self):
+        """Releases the resources of the store.
+        Nothing to do for stores kept in memory."""
+
+    def view(self, name):
+        """Zero-copy view of the stored values of a column
+
+        Parameters
+        ----------
+        name : str
+            Name of the column
+
+        Returns
+        -------
+        np.ndarray
+            The first `size` elements of the column.
+        """
+        return self.columns[name][: self.size]
+
+    def views(self):
+        """Zero-copy views of all the columns
+
+        Returns
+        -------
+        OrderedDict
+            Maping from each column name to its view.
+        """
+        return OrderedDict((name, self.view(name)) for name in self.names)
+
+    def rows(self):
+        """Stored values as a list of tuples of python objects
+
+        Returns
+        -------
+        list of tuple
+            One tuple for each row.
+        """
+        return list(zip(*[self.view(name).tolist() for name in self.names]))
+
+    def to_df(self, start=0):
+        """Creates a dataframe with a copy of the stored values
+
+        Parameters
+        ----------
+        start : int
+            First row to include. The index of the
+            dataframe starts at this value.
+
+        Returns
+        -------
+        pd.DataFrame
+            One row for each row stored from `start` on and
+            one column for each column in `names`.
+        """
+        data = OrderedDict(
+            (name, self.columns[name][start: self.size])
+            for name in self.names)
+        index = pd.RangeIndex(start, self.size)
+        return pd.DataFrame(data, columns=self.names, index=index, copy=True)
+
+
+class MemmapColumnStore(ColumnStore):
+    """A `ColumnStore` where each column is a `numpy.memmap`
+    backed by its own file, so the stored values do not need to
+    fit in memory.
+
+    Columns have a fixed dtype and values are cast to it. When the
+    capacity is exceeded, the files are extended (doubling their size)
+    and mapped again. Existing files in `path` are overwritten.
+
+    Parameters
+    ----------
+    path : str
+        Directory where the files are created, one per column,
+        named after the column with the `.dat` extension.
+    names : list of str
+        Name of the columns, in order.
+    dtypes : list of dtypes
+        Dtype of each column.
+    capacity : int
+        Number of rows to preallocate.
+
+    Examples
+    ---------
+    >>> import tempfile
+    >>> path = tempfile.mkdtemp()
+    >>> cs = MemmapColumnStore(path, ['a', 'b'], ['float64', 'bool'])
+    >>> cs.append((1, True))
+    0
+    >>> cs.view('a')
+    memmap([1.])
+    >>> sorted(os.listdir(path))
+    ['a.dat', 'b.dat']
+    >>> cs.close()
+    """
+
+    def __init__(self, path, names, dtypes, capacity=0):
+        self.path = path
+        self.names = list(names)
+        self.dtypes = OrderedDict(
+            (name, np.dtype(d)) for name, d in zip(self.names, dtypes))
+        self.size = 0
+        self.capacity = max(capacity, self.min_capacity)
+        os.makedirs(path, exist_ok=True)
+        self.columns = OrderedDict()
+        for name in self.names:
+            filename = self.filename(name)
+            open(filename, 'wb').close()
+            self.columns[name] = self._map(name, self.capacity)
+
+    def filename(self, name):
+        """Path of the file backing the column `name`"""
+        return os.path.join(self.path, '{}.dat'.format(name))
+
+    def _map(self, name, capacity):
+        """Resizes the file of a column to hold `capacity`
+        values and maps it in memory."""
+        dtype = self.dtypes[name]
+        filename = self.filename(name)
+        with open(filename, 'r+b') as f:
+            f.truncate(capacity * dtype.itemsize)
+        return np.memmap(filename, dtype=dtype, mode='r+', shape=(capacity,))
+
+    def reserve(self, n):
+        if n <= self.capacity:
+            return
+        capacity = max(n, 2 * self.capacity, self.min_capacity)
+        for name in self.names:
+            self.columns[name].flush()
+            self.columns[name] = self._map(name, capacity)
+        self.capacity = capacity
+
+    def _ensure_dtype(self, name, dtype):
+        return self.columns[name]
+
+    def flush(self):
+        """Writes to disk all the pending changes"""
+        for col in self.columns.values():
+            col.flush()
+
+    def close(self):
+        """Flushes the changes and releases the maps.
+        The store can not be used afterwards."""
+        self.flush()
+        self.columns = OrderedDict()
+
+
+def bid_arrays(bids):
+    """Columns and identifiers of a collection of bids given
+    either as a dataframe or as the arrays of `BidManager.get_arrays`,
+    so that mechanisms can accept both without building a dataframe.
+
+    Parameters
+    ----------
+    bids : pd.DataFrame or OrderedDict
+        Collection of bids, as returned by `BidManager.get_df`
+        or `BidManager.get_arrays`.
+
+    Returns
+    -------
+    columns : OrderedDict
+        Maping from each attribute to the array with its values.
+        No data is copied.
+    index : np.ndarray
+        Identifier of each bid: the index of the dataframe, the
+        `bid` array or, if there is none, the position of each bid.
+
+    Examples
+    ---------
+    >>> bm = pm.BidManager()
+    >>> bm.add_bids([1, 2, 3], [3, 1, 2], [0, 1, 2])
+    range(0, 3)
+    >>> bm.cancel_bid(1)
+    >>> columns, index = bid_arrays(bm.get_arrays())
+    >>> columns['price'], index
+    (array([3, 2]), array([0, 2]))
+    """
+    if isinstance(bids, pd.DataFrame):
+        columns = OrderedDict((c, bids[c].values) for c in bids.columns)
+        return columns, bids.index.values
+    columns = OrderedDict((c, v) for c, v in bids.items() if c != 'bid')
+    if 'bid' in bids:
+        index = np.asarray(bids['bid'])
+    else:
+        index = np.arange(np.asarray(columns['quantity']).shape[0])
+    return columns, index
+
+
+def bid_positions(index, bid_ids):
+    """Positions in `index` of the bids `bid_ids`
+
+    Parameters
+    ----------
+    index : np.ndarray
+        Identifier of each bid, as returned by `bid_arrays`.
+    bid_ids : np.ndarray
+        Identifiers to locate.
+
+    Returns
+    -------
+    np.ndarray
+        Position of each identifier, -1 for the ones
+        that are not in `index`.
+
+    Examples
+    ---------
+    >>> bid_positions(np.array([3, 4, 5]), np.array([5, 3]))
+    array([2, 0])
+    >>> bid_positions(np.array([3, 7, 5]), np.array([5, 3]))
+    array([2, 0])
+    """
+    index = np.asarray(index)
+    bid_ids = np.asarray(bid_ids, dtype='int64')
+    n = index.shape[0]
+    if n > 0 and index.dtype.kind in 'iu' and \
+            index[-1] - index[0] == n - 1 and np.all(np.diff(index) == 1):
+        positions = bid_ids - index[0]
+        positions[(positions < 0) | (positions >= n)] = -1
+        return positions
+    return pd.Index(index).get_indexer(bid_ids)
@@ -1,13 +1,114 @@
 from functools import wraps
 import numpy as np
+from pymarket.utils.cache import LRUCache, fingerprint
+from pymarket.utils.columns import bid_arrays
 
 PRECISION = 8
 
 
+class EqualPriceError(ValueError, NotImplementedError):
+    """Raised when some user has two bids with the
+    same price in the same side of the market
+
+    It is also a `NotImplementedError`, the error raised
+    before for these bids.
+
+    Parameters
+    ----------
+    bids : np.ndarray
+        Identifiers of the offending bids
+
+    Attributes
+    -----------
+    bids : np.ndarray
+        Identifiers of the offending bids
+    """
+
+    def __init__(self, bids):
+        self.bids = np.asarray(bids)
+        super().__init__(
+            'Some users have two bids with the same price in the same '
+            'side, bids {}'.format(self.bids.tolist()))
+
+
+def find_equal_price(bids):
+    """Finds the bids of users that have another bid
+    with the same price in the same side of the market
+
+    The side, price and user of each bid are packed in a
+    single integer key and the repeated keys are found
+    with one `np.unique`.
+
+    Parameters
+    ----------
+    bids : pd.DataFrame or OrderedDict
+        Collection of bids to check, as a dataframe or
+        as the arrays of `BidManager.get_arrays`
+
+    Returns
+    -------
+    np.ndarray
+        Identifiers of the offending bids, in the order of `bids`
+
+    Examples
+    ---------
+    >>> bm = pm.BidManager()
+    >>> bm.add_bids([1, 2, 1, 3], [2, 2, 2, 2], [0, 0, 1, 0], [True, True, True, False])
+    range(0, 4)
+    >>> find_equal_price(bm.get_df())
+    array([0, 1])
+    """
+    columns, index = bid_arrays(bids)
+    if index.shape[0] == 0:
+        return index[:0]
+    _, price = np.unique(columns['price'], return_inverse=True)
+    _, user = np.unique(columns['user'], return_inverse=True)
+    side = np.asarray(columns['buying']).astype('int64')
+    keys = (side * (price.max() + 1) + price) * (user.max() + 1) + user
+    _, inverse, counts = np.unique(
+        keys, return_inverse=True, return_counts=True)
+    return index[counts[inverse] > 1]
+
+
+_validated = LRUCache(maxsize=32)
+
+
+def validate_equal_price(bids):
+    """Checks that no user has two bids with the
+    same price in the same side of the market
+
+    The result is cached with a fingerprint of the side,
+    price, user and identifier of every bid, so a collection of
+    bids that did not change is only checked once.
+
+    Parameters
+    ----------
+    bids : pd.DataFrame or OrderedDict
+        Collection of bids to check, as a dataframe or
+        as the arrays of `BidManager.get_arrays`
+
+    Raises
+    ------
+    EqualPriceError
+        If some user has two bids with the same
+        price in the same side.
+    """
+    columns, index = bid_arrays(bids)
+    key = fingerprint(
+        columns['price'], columns['user'], columns['buying'], index)
+    offending = _validated.get(key)
+    if offending is None:
+        offending = find_equal_price(bids)
+        _validated.put(key, offending)
+
+    if offending.shape[0] > 0:
+        raise EqualPriceError(offending)
+
+
 def check_equal_price(f):
     """CHeck wheather there are two bids
     with the same price in the same side
-    and in that case rises an error
+    and in that case rises an `EqualPriceError`
 
     Parameters
     ----------
@@ -34,16 +135,6 @@ def check_equal_price(f):
         -------
 
         """
-        bids = args[0]
-
-        buy = bids.loc[bids['buying'], :]
-        sell = bids.loc[~bids['buying'], :]
-        dfs = [buy, sell]
-
-        for df in dfs:
-            count = df.groupby(['price', 'user'])['user'].count()
-            count = count > 1
-            if count.any():
-                raise NotImplementedError
+        validate_equal_price(args[0])
         return f(*args, **kwds)
     return wrapper
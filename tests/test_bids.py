@@ -1,6 +1,7 @@
 import pytest
 import pandas as pd
 import numpy as np
+import pymarket
 from pymarket.bids import BidManager
 from pymarket.bids.processing import merge_same_price
 
@@ -64,4 +65,370 @@ def test_merge_same_price():
 
     assert np.allclose(X_original, X_new)
     for k in maping_original:
-        assert maping_original[k] == maping[k]
\ No newline at end of file
+        assert maping_original[k] == maping[k]
+
+def test_merge_same_price_arrays():
+    """
+    The array version agrees with the dataframe
+    version and keeps the labels of the bids
+    """
+    bm = BidManager()
+    bm.add_bids(
+        [1, 3, 2.3, 2.1, 0.4, 0.5, 4.2, 0.1],
+        [100, 100, 85, 90, 90, 90, 1, 90],
+        [0, 1, 2, 7, 8, 4, 5, 6],
+        [True] * 5 + [False] * 3)
+    bm.cancel_bid(2)
+    df = bm.get_df()
+
+    columns, offsets, bid_ids = pymarket.bids.processing.merge_same_price_arrays(df)
+    df_new, maping = merge_same_price(df)
+
+    assert offsets.tolist() == [0, 2, 4, 5, 7]
+    assert bid_ids.tolist() == [3, 4, 0, 1, 6, 5, 7]
+    for i in range(len(offsets) - 1):
+        assert maping[i] == bid_ids[offsets[i]: offsets[i + 1]].tolist()
+    assert np.allclose(df_new.quantity.values, columns['quantity'])
+    assert df_new.user.tolist() == [9, 10, 5, 11]
+    assert df_new.buying.dtype == bool
+
+
+def test_bid_manager_arrays():
+    """
+    Check that the arrays grow when needed, keep
+    the dtypes of the input and are views of the
+    stored bids
+    """
+    bm = BidManager()
+    for i in range(40):
+        assert bm.add_bid(1, 2, i, i % 2 == 0) == i
+    bm.add_bid(0.5, 3, 40, False)
+
+    arrays = bm.get_arrays()
+    assert arrays['quantity'].dtype == np.float64
+    assert arrays['price'].dtype == np.int64
+    assert arrays['buying'].dtype == bool
+    assert arrays['quantity'].shape[0] == 41
+    assert np.shares_memory(arrays['price'], bm.get_arrays()['price'])
+
+    df = bm.get_df()
+    df2 = pd.DataFrame(bm.bids, columns=BidManager.col_names)
+    assert df2.equals(df)
+
+
+def test_bid_manager_cached_df():
+    """
+    The dataframe shares the stored arrays, it is
+    read-only and new columns do not leak
+    """
+    bm = BidManager()
+    bm.add_bid(1, 2, 0)
+    bm.add_bid(2, 3, 1, False)
+    df = bm.get_df()
+    assert np.shares_memory(df.price.values, bm._store.view('price'))
+    assert bm.get_df() is not df
+
+    df['slot'] = 1
+    with pytest.raises(ValueError):
+        df.loc[0, 'price'] = 10
+    assert list(bm.get_df().columns) == BidManager.col_names
+    assert bm.get_df().loc[0, 'price'] == 2
+
+    bm.add_bid(1.5, 1, 2, False)
+    df_new = bm.get_df()
+    assert df_new is not df
+    assert df.shape[0] == 2
+    assert df_new.equals(pd.DataFrame(bm.bids, columns=BidManager.col_names))
+
+
+def test_add_bids():
+    """
+    Adding bids in bulk as arrays, tuples or
+    a dataframe gives the same result as adding
+    them one by one
+    """
+    r = np.random.RandomState(1234)
+    bids = pymarket.datasets.generate(5, 4, r=r)
+
+    bm = BidManager()
+    for b in bids:
+        bm.add_bid(*b)
+
+    bm_tuples = BidManager()
+    assert bm_tuples.add_bids(bids) == range(0, 9)
+
+    df = bm.get_df()
+    bm_arrays = BidManager()
+    ids = bm_arrays.add_bids(
+        df.quantity.values, df.price.values, df.user.values,
+        df.buying.values)
+    assert ids == range(0, 9)
+
+    bm_df = BidManager()
+    bm_df.add_bid(1, 1, 10)
+    assert bm_df.add_bids(df) == range(1, 10)
+
+    assert bm_tuples.get_df().equals(df)
+    assert bm_arrays.get_df().equals(df)
+    assert bm_df.get_df().iloc[1:].reset_index(drop=True).equals(df)
+
+
+def test_add_bids_invalid():
+    """
+    Invalid bids are rejected and nothing is added
+    """
+    bm = BidManager()
+    with pytest.raises(ValueError):
+        bm.add_bids([1, -1], [1, 2], [0, 1])
+    with pytest.raises(ValueError):
+        bm.add_bids([1, 2], [1, np.nan], [0, 1])
+    with pytest.raises(ValueError):
+        bm.add_bids([1, 2], [1, 2, 3], [0, 1])
+    with pytest.raises(ValueError):
+        bm.add_bids([1, 2], [1, 2], [0, 1], buying=[2, 0])
+    assert bm.n_bids == 0
+    assert bm.get_df().shape[0] == 0
+
+
+def test_cancel_amend_bids():
+    """
+    Cancelled bids disappear, amended bids change,
+    and identifiers are kept after compaction
+    """
+    bm = BidManager()
+    bm.add_bids(np.arange(10), np.arange(10) * 1.5, np.arange(10))
+    bm.cancel_bid(3)
+    bm.amend_bid(4, quantity=0.5, price=2)
+
+    df = bm.get_df()
+    assert list(df.index) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert df.loc[4, 'quantity'] == 0.5
+    assert df.loc[4, 'price'] == 2
+
+    with pytest.raises(KeyError):
+        bm.cancel_bid(3)
+    with pytest.raises(KeyError):
+        bm.amend_bid(10, price=1)
+    with pytest.raises(ValueError):
+        bm.amend_bid(4, quantity=-1)
+
+    for i in [0, 1, 2, 5, 6]:
+        bm.cancel_bid(i)
+    # More than half of the bids were cancelled
+    assert bm.n_cancelled == 0
+    assert bm.add_bid(1, 1, 10) == 10
+    bm.amend_bid(9, quantity=3)
+    bm.cancel_bid(7)
+
+    df = bm.get_df()
+    assert list(df.index) == [4, 8, 9, 10]
+    assert list(df.quantity) == [0.5, 8, 3, 1]
+    assert list(bm.get_arrays()['bid']) == [4, 8, 9, 10]
+
+
+def test_reads_do_not_compact():
+    """
+    Reading the bids leaves the cancelled bids in the
+    store until the ratio is reached or compact is called
+    """
+    bm = BidManager()
+    bm.add_bids(np.arange(10), np.arange(10) * 1.5, np.arange(10))
+    bm.cancel_bid(3)
+    arrays = bm.get_arrays()
+    assert list(arrays['bid']) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert len(bm.bids) == 9
+    assert bm.get_df().shape[0] == 9
+    assert (bm.n_cancelled, len(bm._store)) == (1, 10)
+    with pytest.raises(ValueError):
+        arrays['price'][0] = 1
+
+    bm.compact()
+    assert (bm.n_cancelled, len(bm._store)) == (0, 9)
+    assert list(bm.get_arrays()['bid']) == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+
+
+def test_mechanisms_with_cancelled_bids():
+    """
+    Mechanisms report the original identifiers
+    of the bids when some bids were cancelled
+    """
+    from pymarket import Market
+
+    mar = Market()
+    mar.accept_bid(1, 10, 0, False)
+    mar.accept_bid(1, 4, 1, True)
+    mar.accept_bid(1, 3, 2, True)
+    mar.accept_bid(1, 2, 3, False)
+    mar.accept_bid(1, 1, 4, False)
+    mar.bm.cancel_bid(0)
+
+    r = np.random.RandomState(1234)
+    trans, extra = mar.run('p2p', r=r)
+    df = trans.get_df()
+    assert 0 not in df.bid.values
+    assert set(df.bid) == {1, 2, 3, 4}
+
+    trans, extra = mar.run('huang')
+    assert set(trans.get_df().bid) <= {1, 2, 3, 4}
+    stats = mar.statistics()
+    assert np.allclose(stats['percentage_traded'], 0.5)
+
+
+def test_memmap_bid_manager(tmp_path, bid_dataset_3):
+    """
+    Bids stored in files give the same results
+    as bids stored in memory
+    """
+    from pymarket import Market
+
+    mar = Market()
+    mar.accept_bids(bid_dataset_3)
+    mar_disk = Market(path=str(tmp_path))
+    mar_disk.bm._store.chunk_size = 3
+    mar_disk.accept_bids(bid_dataset_3)
+    for i in range(40):
+        mar_disk.accept_bid(1, 10, 10 + i, False)
+        mar_disk.bm.cancel_bid(8 + i)
+    mar_disk.bm.compact()
+
+    arrays = mar_disk.bm.get_arrays()
+    assert isinstance(arrays['price'], np.memmap)
+    assert arrays['price'].shape[0] == 8
+    assert np.allclose(arrays['price'], bid_dataset_3.price.values)
+
+    # The mechanisms read the arrays, no dataframe is built
+    def no_df():
+        raise AssertionError('get_df should not be called')
+    mar_disk.bm.get_df = no_df
+    for algo in ['huang', 'muda']:
+        args = [np.random.RandomState(2)] if algo == 'muda' else []
+        trans, extra = mar.run(algo, *args)
+        args = [np.random.RandomState(2)] if algo == 'muda' else []
+        trans_disk, extra_disk = mar_disk.run(algo, *args)
+        assert np.allclose(
+            trans.get_df().values.astype(float),
+            trans_disk.get_df().values.astype(float))
+        assert extra.keys() == extra_disk.keys()
+        for key in extra:
+            assert np.allclose(extra[key], extra_disk[key])
+
+    mar_disk.close()
+    quantity = np.memmap(str(tmp_path / 'quantity.dat'), dtype='float64')
+    assert np.allclose(quantity[:8], bid_dataset_3.quantity.values)
+
+
+def test_sorted_index():
+    """
+    The incrementally maintained index matches sorting
+    the active bids from scratch after inserting,
+    amending and cancelling bids
+    """
+    r = np.random.RandomState(1234)
+    bm = BidManager()
+
+    def check():
+        df = bm.get_df()
+        for buying in [True, False]:
+            side = df[df.buying == buying]
+            key = -side.price.values if buying else side.price.values
+            expected = side.index.values[np.argsort(key, kind='mergesort')]
+            assert np.array_equal(bm.sorted_index(buying), expected)
+
+    for step in range(20):
+        n = r.randint(1, 20)
+        bm.add_bids(
+            r.randint(1, 5, n), r.randint(0, 10, n),
+            np.arange(n), r.rand(n) > 0.5)
+        check()
+        alive = bm.get_df().index.values
+        for bid in r.choice(alive, 3, replace=False):
+            bm.amend_bid(bid, price=r.randint(0, 10))
+        check()
+        for bid in r.choice(alive, n // 2, replace=False):
+            bm.cancel_bid(bid)
+        check()
+
+        # Amended bids are merged lazily, also after a compaction
+        order = bm._order[True]
+        alive = bm.get_df().index.values
+        for bid in r.choice(alive, 4):
+            bm.amend_bid(bid, price=r.randint(0, 10))
+        assert bm._order[True] is order
+        for bid in r.choice(alive, len(alive) // 2, replace=False):
+            bm.cancel_bid(bid)
+        check()
+
+
+def test_sorted_index_matches_unsorted_path():
+    """
+    Curves and mechanisms given the sorted index of the
+    BidManager give the same results as sorting the bids
+    """
+    from pymarket.mechanisms import HuangAuction, muda
+    from pymarket.bids.demand_curves import demand_curve_from_bids
+
+    r = np.random.RandomState(42)
+    for _ in range(20):
+        bm = BidManager()
+        n = r.randint(4, 30)
+        bm.add_bids(
+            r.randint(1, 5, n), r.randint(0, 10, n), np.arange(n),
+            r.rand(n) > 0.5)
+        for bid in r.choice(n, 3, replace=False):
+            bm.amend_bid(bid, price=r.randint(0, 10))
+        df = bm.get_df()
+        order = bm.sorted_index(True), bm.sorted_index(False)
+
+        dc, index = demand_curve_from_bids(df, order[0])
+        dc_sorted, index_sorted = demand_curve_from_bids(df)
+        assert np.array_equal(dc[:, 1], dc_sorted[:, 1])
+        assert np.allclose(dc[-2:, 0], dc_sorted[-2:, 0])
+        assert set(index) == set(index_sorted)
+
+        for bids in [df, bm.get_arrays()]:
+            trans, extra = HuangAuction(bids, order=order).run()
+            expected, extra_expected = HuangAuction(df).run()
+            assert trans.get_df().equals(expected.get_df())
+            assert extra == extra_expected
+
+            trans, extra = muda(bids, np.random.RandomState(0), order)
+            expected, extra_expected = muda(df, np.random.RandomState(0))
+            assert np.allclose(
+                trans.get_df().values.astype(float),
+                expected.get_df().values.astype(float))
+            assert np.array_equal(extra['fees'], extra_expected['fees'])
+
+
+def test_new_player_id_in_threads():
+    """
+    Generators driven from different threads
+    keep their own counters
+    """
+    import sys
+    import threading
+    from pymarket.bids.processing import new_player_id
+
+    n = 5000
+    results = {}
+    barrier = threading.Barrier(2)
+
+    def generate(name):
+        id_gen = new_player_id(100)
+        barrier.wait()
+        results[name] = [id_gen([0, 1]) for _ in range(n)]
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [threading.Thread(target=generate, args=(name,))
+                   for name in ['a', 'b']]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    expected = list(range(100, 100 + n))
+    assert results['a'] == expected
+    assert results['b'] == expected
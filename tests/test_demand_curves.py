@@ -80,3 +80,249 @@ def test_equilibrium_quantity_1(bid_dataset_1):
     assert np.allclose(demand_index, 5)
     assert np.allclose(supply_index, 3)
     assert np.allclose(price, 5)
+
+
+def test_curves_with_sorted_index():
+    """
+    Curves built with the index maintained by
+    the BidManager match the ones sorting the bids
+    """
+    bm = BidManager()
+    bm.add_bids([1, 2, 5, 4, 1, 5], [3, 4, 1, 2, 1, 6],
+                [0, 1, 2, 3, 4, 5], [True] * 3 + [False] * 3)
+    df = bm.get_df()
+
+    dc, index = demand_curve_from_bids(df, bm.sorted_index(True))
+    dc_, index_ = demand_curve_from_bids(df)
+    assert np.allclose(dc, dc_)
+    assert np.array_equal(index, index_)
+
+    sc, index = supply_curve_from_bids(df, bm.sorted_index(False))
+    sc_, index_ = supply_curve_from_bids(df)
+    assert np.allclose(sc, sc_)
+    assert np.array_equal(index, index_)
+
+
+def test_intersect_stepwise_matches_pointwise():
+    """The intersection agrees with evaluating both
+    curves point by point in all the breakpoints"""
+    r = np.random.RandomState(0)
+    for _ in range(200):
+        n, m = r.randint(1, 8, 2)
+        f = np.c_[np.cumsum(r.randint(1, 4, n)), np.sort(r.randint(0, 10, n))[::-1]]
+        g = np.c_[np.cumsum(r.randint(1, 4, m)), np.sort(r.randint(0, 10, m))]
+        f = np.vstack([f, [np.inf, 0]])
+        g = np.vstack([g, [np.inf, np.inf]])
+
+        x_max = min(f[:, 0].max(), g[:, 0].max())
+        xs = sorted(x for x in set(f[:, 0]) | set(g[:, 0]) if x <= x_max)
+        fext = [get_value_stepwise(x, f) for x in xs]
+        gext = [get_value_stepwise(x, g) for x in xs]
+        x_true = None
+        for i in range(len(xs) - 1):
+            if fext[i] > gext[i] and fext[i + 1] < gext[i + 1]:
+                x_true = xs[i]
+
+        x_ast, f_ast, g_ast, v = intersect_stepwise(f, g)
+        assert x_ast == x_true
+        if x_ast is not None:
+            assert f[f_ast, 0] >= x_ast and (f_ast == 0 or f[f_ast - 1, 0] < x_ast)
+            assert g[g_ast, 0] >= x_ast and (g_ast == 0 or g[g_ast - 1, 0] < x_ast)
+
+
+def test_get_values_stepwise(bid_dataset_0):
+    """The vectorized evaluation agrees with the scalar
+    one and the inverse recovers the breakpoints"""
+    dc, _ = demand_curve_from_bids(bid_dataset_0)
+    sc, _ = supply_curve_from_bids(bid_dataset_0)
+    xs = np.array([-1, 0, 0.5, 1, 2.5, 3, 7, 8, 10, 11, np.inf])
+    for curve in [dc, sc]:
+        values = get_values_stepwise(xs, curve)
+        expected = [get_value_stepwise(x, curve) for x in xs]
+        expected = np.array([np.nan if v is None else v for v in expected])
+        assert np.allclose(values, expected, equal_nan=True)
+
+    assert np.allclose(get_quantities_stepwise(dc[:-1, 1], dc), dc[:-1, 0])
+    assert np.allclose(get_quantities_stepwise(sc[:-1, 1], sc), sc[:-1, 0])
+    assert np.allclose(get_quantities_stepwise([10, 0], dc), [0, 8])
+    assert np.allclose(get_quantities_stepwise([0, 10], sc), [0, 10])
+
+
+def test_step_curve(bid_dataset_0):
+    """StepCurve agrees with the array curves"""
+    dc, d_index = demand_curve_from_bids(bid_dataset_0)
+    sc, s_index = supply_curve_from_bids(bid_dataset_0)
+    demand = StepCurve.from_bids(bid_dataset_0, buying=True)
+    supply = StepCurve.from_bids(bid_dataset_0, buying=False)
+
+    assert np.array_equal(demand.to_array(), dc)
+    assert np.array_equal(supply.index, s_index)
+    assert len(demand) == 3
+    assert demand.intersect(supply) == intersect_stepwise(dc, sc)
+
+    rebuilt = StepCurve(supply.quantity, supply.price, supply.index, False)
+    assert np.array_equal(rebuilt.to_array(), sc)
+
+    xs = np.array([0, 0.5, 1, 3, 8])
+    assert np.allclose(demand.price_at(xs), get_values_stepwise(xs, dc))
+    assert np.allclose(supply.quantity_at([0, 1, 2, 6]), [0, 1, 5, 10])
+    assert demand.surplus(2) == 2 * 2 + 1 * 1
+    assert supply.surplus(2) == 1 * 1
+    with pytest.raises(AttributeError):
+        demand.extra = 1
+
+
+def test_aggregate_curve():
+    """The incremental curves agree with the
+    curves built from scratch after each bid"""
+    r = np.random.RandomState(3)
+    ac = AggregateCurve(0, 20, 1)
+    bm = BidManager()
+    for _ in range(60):
+        if bm.n_bids > 0 and r.rand() < 0.2:
+            df = bm.get_df()
+            i = r.choice(df.index.values)
+            ac.cancel(df.quantity[i], df.price[i], df.buying[i])
+            bm.cancel_bid(i)
+        else:
+            q, p, b = r.randint(1, 5), r.randint(0, 21), r.rand() < 0.5
+            ac.add(q, p, b)
+            bm.add_bid(q, p, 0, b)
+        df = bm.get_df()
+        buy = df[df.buying]
+        sell = df[~df.buying]
+        for p in [0, 5, 10.2, 20]:
+            assert np.isclose(ac.demand_at(p), buy.quantity[buy.price >= round(p)].sum())
+            assert np.isclose(ac.supply_at(p), sell.quantity[sell.price <= round(p)].sum())
+
+        expected = None
+        if buy.shape[0] > 0 and sell.shape[0] > 0:
+            for p in range(21):
+                d = buy.quantity[buy.price >= p].sum()
+                s = sell.quantity[sell.price <= p].sum()
+                if s >= d:
+                    expected = p
+                    break
+        assert ac.clearing_price() == expected
+
+    with pytest.raises(ValueError):
+        ac.add(1, 25, True)
+
+
+def test_aggregate_curve_cancel():
+    """Only bids that were added can be cancelled, and
+    cancelling float quantities leaves no residue"""
+    ac = AggregateCurve(0, 10, 1)
+    with pytest.raises(ValueError):
+        ac.cancel(1, 3, True)
+
+    ac.add(0.1, 3, True)
+    ac.add(0.2, 3, True)
+    ac.add(0.3, 2, False)
+    with pytest.raises(ValueError):
+        ac.cancel(0.3, 3, False)
+    with pytest.raises(ValueError):
+        ac.cancel(0.4, 3, True)
+    assert ac.clearing_price() == 2.0
+
+    ac.cancel(0.1, 3, True)
+    ac.cancel(0.2, 3, True)
+    assert ac.buy.total != 0
+    assert ac.clearing_price() is None
+
+
+def test_intersect_stepwise_batch():
+    """The batch intersection gives the same result
+    as intersecting each pair on its own"""
+    r = np.random.RandomState(7)
+    fs, gs = [], []
+    for i in range(300):
+        n, m = r.randint(1, 8, 2)
+        f = np.c_[np.cumsum(r.randint(1, 4, n)), np.sort(r.randint(0, 10, n))[::-1]]
+        g = np.c_[np.cumsum(r.randint(1, 4, m)), np.sort(r.randint(0, 10, m))]
+        if i % 3:
+            f = np.vstack([f, [np.inf, 0]])
+            g = np.vstack([g, [np.inf, np.inf]])
+        fs.append(f.astype(float))
+        gs.append(g.astype(float))
+
+    f, f_offsets = pack_curves(fs)
+    g, g_offsets = pack_curves(gs)
+    x_ast, f_ast, g_ast, v = intersect_stepwise_batch(f, f_offsets, g, g_offsets)
+
+    for i in range(len(fs)):
+        x, fa, ga, vv = intersect_stepwise(fs[i], gs[i])
+        if x is None:
+            assert np.isnan(x_ast[i]) and f_ast[i] == -1 and g_ast[i] == -1
+        else:
+            assert (x_ast[i], f_ast[i], g_ast[i]) == (x, fa, ga)
+        assert v[i] == vv or (np.isnan(v[i]) and np.isnan(vv))
+
+
+def test_binned_curves_bounds():
+    """The exact clearing price and quantity are within
+    the error reported by the binned curves, also when
+    the bids are added in chunks"""
+    r = np.random.RandomState(11)
+    for _ in range(50):
+        n = r.randint(2, 500)
+        q = r.rand(n) * 5
+        p = np.round(r.rand(n) * 100, r.randint(0, 3))
+        b = r.rand(n) < 0.5
+
+        bc = BinnedCurves(np.linspace(0, 100, r.randint(2, 100)))
+        for chunk in np.array_split(np.arange(n), 3):
+            bc.add(q[chunk], p[chunk], b[chunk])
+        res = bc.clear()
+
+        for x in np.unique(p):
+            supply = q[~b & (p <= x)].sum()
+            demand = q[b & (p >= x)].sum()
+            if supply >= demand:
+                break
+        assert abs(res['price'] - x) <= res['price_error'] + 1e-9
+        assert abs(res['quantity'] - min(supply, demand)) <= res['quantity_error'] + 1e-9
+
+    with pytest.raises(ValueError):
+        bc.add([1], [101], [True])
+
+
+def test_curve_cache(bid_dataset_0, bid_dataset_1):
+    """Unchanged managers reuse their curves, any change
+    builds them again and the least recently used curves
+    are evicted first"""
+    bm = BidManager()
+    bm.add_bids(bid_dataset_0)
+    other = BidManager()
+    other.add_bids(bid_dataset_0)
+
+    cache = CurveCache(maxsize=2)
+    dc, index = cache.get(bm, buying=True)
+    expected, expected_index = demand_curve_from_bids(bm.get_df())
+    assert np.array_equal(dc, expected)
+    assert np.array_equal(index, expected_index)
+    with pytest.raises(ValueError):
+        dc[0, 0] = 10
+
+    assert cache.get(bm, buying=True)[0] is dc
+    sc, _ = cache.get(bm, buying=False)
+    assert np.array_equal(sc, supply_curve_from_bids(bm.get_df())[0])
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # Other managers never share the curves
+    assert cache.get(other, buying=True)[0] is not dc
+    assert len(cache) == 2
+    assert cache.get(bm, buying=True)[0] is not dc
+    assert (cache.hits, cache.misses) == (1, 4)
+
+    for change in [lambda: bm.add_bids(bid_dataset_1),
+                   lambda: bm.amend_bid(0, price=10),
+                   lambda: bm.cancel_bid(1)]:
+        dc, _ = cache.get(bm, buying=True)
+        change()
+        new_dc, _ = cache.get(bm, buying=True)
+        assert new_dc is not dc
+        assert np.array_equal(new_dc, demand_curve_from_bids(bm.get_df())[0])
+
+    cache.clear()
+    assert len(cache) == 0 and cache.hits == 0
@@ -1,6 +1,9 @@
+import pytest
 from pymarket.mechanisms import *
 from pymarket.bids import *
 from pymarket.transactions import *
+from pymarket.mechanisms.huang_auction import update_quantity, \
+    _update_quantity_segments
 
 def test_huang_auction_with_dataset_0(bid_dataset_0):
     """Test the huang auction with dataset 0
@@ -54,3 +57,140 @@ def test_huang_auction_with_dataset_3(bid_dataset_3):
         ]).astype(float)
 
     assert np.allclose(true_trans, df)
+
+
+def test_huang_auction_in_threads():
+    """Concurrent clearings with merged players
+    give the same result as running them one
+    after the other"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    r = np.random.RandomState(1234)
+    markets = []
+    for _ in range(16):
+        bm = BidManager()
+        n = 40
+        bm.add_bids(
+            r.randint(1, 5, n),
+            r.randint(1, 10, n),
+            r.randint(0, 10, n),
+            r.rand(n) > 0.5)
+        markets.append(bm.get_df())
+
+    def clear(bids):
+        mec = HuangAuction(bids)
+        trans, _ = mec.run()
+        return mec.bids, trans.get_df()
+
+    serial = [clear(bids) for bids in markets]
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        parallel = list(pool.map(clear, markets))
+
+    for (b1, t1), (b2, t2) in zip(serial, parallel):
+        assert b1.equals(b2)
+        assert t1.equals(t2)
+
+
+def test_huang_auction_arrays():
+    """The array kernel reports the bid labels
+    and balances both sides of the market"""
+    r = np.random.RandomState(5)
+    bm = BidManager()
+    n = 200
+    bm.add_bids(r.rand(n), r.rand(n), np.arange(n), r.rand(n) > 0.5)
+    for i in range(0, n, 7):
+        bm.cancel_bid(i)
+    bids = bm.get_df()
+
+    bid, traded, paid, extra = huang_auction_arrays(
+        bids.quantity.values, bids.price.values, bids.buying.values,
+        bids.index.values)
+    trans, extra_df = huang_auction(bids)
+    df = trans.get_df()
+
+    assert np.array_equal(df.bid.values, bid)
+    assert np.allclose(df.quantity.values, traded)
+    assert extra == extra_df
+    assert not np.isin(bid, np.arange(0, n, 7)).any()
+
+    buyers = bids.buying[bid].values
+    assert np.isclose(traded[buyers].sum(), traded[~buyers].sum())
+    assert np.isclose(traded[buyers].sum(), extra['quantity_traded'])
+    assert (paid[buyers] == extra['price_buy']).all()
+    assert (paid[~buyers] == extra['price_sell']).all()
+    assert (bids.price[bid[buyers]] > extra['price_buy']).all()
+    assert (bids.price[bid[~buyers]] < extra['price_sell']).all()
+
+
+def test_update_quantity_many_small_traders():
+    """Rationing removes the small traders one by one
+    exactly as the sequential procedure does"""
+    def sequential(quantity, gap):
+        quantity = quantity * 1.0
+        N = len(quantity)
+        while np.nanmin(quantity) < gap / N:
+            i = np.nanargmin(quantity)
+            gap -= quantity[i]
+            quantity[i] = np.nan
+            N -= 1
+        quantity = np.nan_to_num(quantity) - float(gap) / N
+        return np.clip(quantity, 0, quantity.max())
+
+    r = np.random.RandomState(2)
+    for _ in range(50):
+        quantity = np.concatenate([r.rand(500) * 0.01, r.rand(20) * 10])
+        quantity[r.rand(quantity.shape[0]) < 0.05] = np.nan
+        gap = np.nansum(quantity) * r.rand() * 0.9
+        assert np.array_equal(update_quantity(quantity, gap), sequential(quantity, gap))
+
+    with pytest.raises(ValueError):
+        update_quantity(np.array([1.]), 2)
+
+
+def test_huang_auction_batch():
+    """Clearing all the slots at once gives the same
+    result as running HuangAuction in each slot"""
+    r = np.random.RandomState(8)
+    n = 600
+    bm = BidManager()
+    bm.add_bids(
+        r.randint(1, 6, n) * 0.5,
+        r.randint(1, 12, n),
+        r.randint(0, 30, n),
+        r.rand(n) > 0.5)
+    slot = r.randint(0, 40, n)
+    bids = bm.get_df().assign(slot=slot)
+    bids = bids.assign(buying=bids.buying.values | (slot == 3))
+
+    trans, extra = huang_auction_batch(bids)
+    assert extra.shape[0] == 40
+
+    for s, df in bids.groupby('slot'):
+        expected, expected_extra = HuangAuction(df.drop(columns='slot')).run()
+        expected = expected.get_df().sort_values('bid')
+        obtained = trans[trans.slot == s].sort_values('bid')
+        assert np.array_equal(expected.bid.values, obtained.bid.values)
+        assert np.allclose(expected.quantity.values, obtained.quantity.values)
+        assert np.allclose(expected.price.values, obtained.price.values)
+        if len(expected_extra) > 0:
+            for k, v in expected_extra.items():
+                assert np.isclose(extra.loc[s, k], v)
+        else:
+            assert np.isnan(extra.loc[s, 'price_buy'])
+
+
+def test_update_quantity_segments():
+    """Rationing all the segments at once gives the same
+    quantities as rationing each segment on its own"""
+    r = np.random.RandomState(11)
+    quantity = r.randint(1, 8, 200) * 0.5
+    segment = r.randint(0, 12, 200)
+    totals = np.bincount(segment, weights=quantity, minlength=13)
+    gap = totals * r.rand(13)
+
+    obtained = _update_quantity_segments(quantity, segment, gap)
+    for s in range(13):
+        mask = segment == s
+        if mask.any():
+            expected = update_quantity(quantity[mask], gap[s])
+            assert np.allclose(obtained[mask], expected)
@@ -1,3 +1,4 @@
+import pytest
 from pymarket.transactions import TransactionManager
 from pymarket.mechanisms import *
 import numpy as np
@@ -87,3 +88,146 @@ def test_muda_dataset_1(bid_dataset_1):
     fees = np.array([1.85, 0, 0, 0, 0, 0, 0, 2.3, 4.6, 0, 0])
     assert np.allclose(fees, fee)
 
+
+
+def test_compute_fees_matches_compute_fee():
+    """All the fees computed together are the
+    same as computing them one user at a time"""
+    r = np.random.RandomState(4)
+    for _ in range(100):
+        n = r.randint(1, 30)
+        bm = BidManager()
+        bm.add_bids(
+            r.randint(1, 5, n) * r.choice([0.3, 1]),
+            r.randint(1, 20, n),
+            r.randint(0, max(1, n // 2), n))
+        side = bm.get_df().sort_values('price', ascending=False, kind='mergesort')
+        quantity = side.quantity.sum() * r.rand()
+        price = 0.5
+        long_side, index = get_trading_bids(side, quantity)
+
+        users = long_side[long_side.index <= index].user.unique()
+        fees = compute_fees(long_side, index, quantity, price, users)
+        for u, fee in zip(users, fees):
+            expected = compute_fee(long_side, index, u, quantity, price)
+            assert np.isclose(fee, expected)
+
+
+def test_muda_monte_carlo_matches_muda():
+    """Each draw of the Monte Carlo engine is the same as
+    calling muda repeatedly with the same random state"""
+    r = np.random.RandomState(7)
+    for seed in range(10):
+        n_buy, n_sell = r.randint(1, 12, 2)
+        bm = BidManager()
+        bm.add_bids(
+            r.randint(1, 10, n_buy) * 0.5,
+            r.permutation(100)[:n_buy], np.arange(n_buy))
+        bm.add_bids(
+            r.randint(1, 10, n_sell) * 0.5,
+            r.permutation(100)[:n_sell],
+            np.arange(n_buy, n_buy + n_sell), False)
+        df = bm.get_df()
+
+        results = muda_monte_carlo(
+            df, 5, np.random.RandomState(seed), batch_size=2)
+        budget = muda_monte_carlo(
+            df, 5, np.random.RandomState(seed),
+            memory_budget=3 * df.shape[0] * 8)
+        arrays = muda_monte_carlo(
+            bm.get_arrays(), 5, np.random.RandomState(seed))
+        for k, v in results.items():
+            assert np.allclose(v, budget[k])
+            assert np.allclose(v, arrays[k])
+        state = np.random.RandomState(seed)
+        for d in range(5):
+            trans, extra = muda(df, state)
+            trans = trans.get_df()
+            for side in ['left', 'right']:
+                assert np.allclose(
+                    results['price_' + side][d], extra['price_' + side])
+                traded = trans.loc[trans.bid.isin(extra[side]), 'quantity']
+                assert np.isclose(
+                    results['quantity_' + side][d], traded.sum() / 2)
+            assert np.allclose(results['fees'][d], extra['fees'])
+
+
+def test_muda_monte_carlo_memory_budget():
+    """The temporaries of a block of partitions fit in the memory
+    budget, also when every user trades in the long side"""
+    import tracemalloc
+    r = np.random.RandomState(2)
+    n = 2000
+    bm = BidManager()
+    bm.add_bids(r.rand(n // 10) + 0.1, r.rand(n // 10) * 10 + 5,
+                np.arange(n // 10))
+    bm.add_bids(r.rand(n - n // 10) + 0.1, r.rand(n - n // 10) * 10,
+                np.arange(n // 10, n), False)
+    arrays = bm.get_arrays()
+    budget = 1 << 22
+    tracemalloc.start()
+    results = muda_monte_carlo(
+        arrays, 60, np.random.RandomState(0), memory_budget=budget)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert peak - sum(v.nbytes for v in results.values()) <= budget
+    assert np.any(results['fees'] > 0)
+
+
+def test_muda_ties_follow_bid_order():
+    """Players of the same side with the same price are
+    ordered as in the bids, as in muda_monte_carlo"""
+    r = np.random.RandomState(3)
+    for seed in range(10):
+        n = r.randint(4, 20)
+        bm = BidManager()
+        bm.add_bids(
+            r.randint(1, 5, n), r.randint(1, 5, n), np.arange(n),
+            r.rand(n) > 0.5)
+        df = bm.get_df()
+        results = muda_monte_carlo(df, 3, np.random.RandomState(seed))
+        state = np.random.RandomState(seed)
+        for d in range(3):
+            trans, extra = muda(df, state)
+            assert np.allclose(results['fees'][d], extra['fees'])
+
+
+def test_get_trading_cut_matches_get_trading_bids():
+    """The cut is the same as the split done by get_trading_bids"""
+    r = np.random.RandomState(11)
+    for _ in range(50):
+        n = r.randint(1, 10)
+        bm = BidManager()
+        bm.add_bids(r.randint(1, 5, n) * 0.5, r.randint(1, 20, n), np.arange(n))
+        side = bm.get_df().sort_values('price', ascending=False)
+        quantity = side.quantity.sum() * r.rand() * 1.2
+        bids, index = get_trading_bids(side, quantity)
+        cut, partial = get_trading_cut(side.quantity.values, quantity)
+        assert cut == index
+        assert np.isclose(bids.quantity.iloc[index], partial)
+
+
+def test_muda_rejects_equal_prices():
+    """The error raised by muda names the bids of the users
+    with two bids at the same price in the same side"""
+    from pymarket.utils.decorators import EqualPriceError, find_equal_price
+    bm = BidManager()
+    bm.add_bids([1, 2, 1], [3, 3, 3], [0, 0, 1])
+    bm.add_bids([1, 1, 1], [2, 3, 2], [2, 0, 2], False)
+    with pytest.raises(EqualPriceError) as error:
+        muda(bm.get_df(), np.random.RandomState(0))
+    assert error.value.bids.tolist() == [0, 1, 3, 5]
+    with pytest.raises(ValueError):
+        muda(bm.get_df(), np.random.RandomState(0))
+    with pytest.raises(NotImplementedError):
+        muda(bm.get_df(), np.random.RandomState(0))
+
+    r = np.random.RandomState(5)
+    for _ in range(50):
+        n = r.randint(1, 30)
+        bm = BidManager()
+        bm.add_bids(1, r.randint(0, 6, n), r.randint(0, 6, n), r.rand(n) > 0.5)
+        df = bm.get_df()
+        counts = df.groupby(['buying', 'price', 'user']).user.transform('count')
+        expected = df.index[counts > 1].values
+        assert np.array_equal(find_equal_price(df), expected)
@@ -1,8 +1,11 @@
+import pytest
 import pandas as pd
 import numpy as np
 
 from pymarket import Market
+from pymarket.bids import BidManager
 from pymarket.transactions import TransactionManager, split_transactions_merged_players
+from pymarket.transactions.processing import maping_to_csr
 from pymarket.bids.processing import merge_same_price
 from pymarket.mechanisms.muda_auction import solve_market_side_with_exogenous_price
 
@@ -42,3 +45,136 @@ def test_split_transactions():
     ]).astype(float)
 
     assert np.allclose(X_obtained, X_true)
+
+
+def test_transactions_cached_df():
+    """
+    The transaction dataframe shares the stored arrays,
+    is read-only and is not changed by new transactions
+    """
+    tm = TransactionManager()
+    tm.add_transaction(0, 1, 2, -1, False)
+    df = tm.get_df()
+    assert np.shares_memory(df.quantity.values, tm._store.view('quantity'))
+    with pytest.raises(ValueError):
+        df.loc[0, 'quantity'] = 5
+    assert tm.get_df().loc[0, 'quantity'] == 1
+
+    tm.add_transaction(1, 0.5, 2, -1, False)
+    df_new = tm.get_df()
+    assert df.shape[0] == 1
+    assert df_new.equals(pd.DataFrame(tm.trans, columns=tm.name_col))
+    assert list(df_new.index) == [0, 1]
+
+
+def test_add_transactions_and_merge():
+    """
+    Bulk insertion matches adding transactions one
+    by one and merging does not copy nor share
+    later additions
+    """
+    data = [(0, 1, 2.5, -1, False), (3, 0.5, 2.5, -1, False),
+            (2, 1.5, 1.0, 4, True)]
+
+    tm_1 = TransactionManager()
+    for t in data:
+        tm_1.add_transaction(*t)
+
+    tm_2 = TransactionManager()
+    ids = tm_2.add_transactions(*[np.array(c) for c in zip(*data)])
+    assert ids == range(0, 3)
+    assert tm_2.get_df().equals(tm_1.get_df())
+    assert tm_2.trans == data
+
+    tm_3 = tm_1.merge(tm_2)
+    assert tm_3.n_trans == 6
+    assert np.shares_memory(
+        tm_3._chunks[0]['quantity'], tm_1._store.view('quantity'))
+
+    tm_1.add_transaction(7, 1, 1, -1, False)
+    assert tm_3.add_transaction(8, 1, 1, -1, False) == 6
+    df = tm_3.get_df()
+    assert list(df.bid) == [0, 3, 2, 0, 3, 2, 8]
+    assert list(df.index) == list(range(7))
+
+
+def test_split_transactions_csr():
+    """
+    Splitting with a dictionary and with the flat
+    representation gives the same transactions as
+    splitting each transaction on its own
+    """
+    bm = BidManager()
+    bm.add_bids([1, 2, 3, 1.5, 0.5], [1, 1, 2, 3, 3], [0, 1, 2, 3, 4])
+    bids = bm.get_df()
+    maping = {0: [0, 1], 1: [2], 2: [3, 4]}
+
+    tm = TransactionManager()
+    tm.add_transaction(2, 1, 2.5, -1, False)
+    tm.add_transaction(0, 1.5, 2, 1, True)
+    tm.add_transaction(1, 3, 2, -1, False)
+
+    expected = [
+        [3, 0.75, 2.5, -1, False],
+        [4, 0.25, 2.5, -1, False],
+        [0, 0.5, 2, 1, True],
+        [1, 1, 2, 1, True],
+        [2, 3, 2, -1, False],
+    ]
+    expected = np.array(expected).astype(float)
+
+    new_trans = split_transactions_merged_players(tm, bids, maping)
+    assert np.allclose(new_trans.get_df().values.astype(float), expected)
+
+    _, offsets, bid_ids = maping_to_csr(maping)
+    new_trans = split_transactions_merged_players(tm, bids, (offsets, bid_ids))
+    assert np.allclose(new_trans.get_df().values.astype(float), expected)
+
+
+def test_split_fees_by_user():
+    """
+    The fees of the merged bids are split among the users of
+    their original bids, even when the identifiers of the merged
+    bids are also identifiers of users
+    """
+    bm = BidManager()
+    bm.add_bids([1, 3, 2, 1], [1, 1, 2, 3], [1, 2, 0, 2])
+    bids = bm.get_df()
+    maping = {0: [0, 1], 1: [2], 2: [3]}
+
+    tm = TransactionManager()
+    tm.add_transaction(0, 2, 1, -1, False)
+    tm.add_transaction(0, 2, 1, -1, False)
+    tm.add_transaction(1, 2, 2, -1, False)
+
+    fees = {0: 4.0, 1: 1.0, 2: 0.5}
+    _, user_fees = split_transactions_merged_players(tm, bids, maping, fees)
+    assert user_fees == {0: 1.0, 1: 1.0, 2: 3.5}
+    assert fees == {0: 4.0, 1: 1.0, 2: 0.5}
+
+    _, offsets, bid_ids = maping_to_csr(maping)
+    _, user_fees = split_transactions_merged_players(
+        tm, bids, (offsets, bid_ids), fees)
+    assert user_fees == {0: 1.0, 1: 1.0, 2: 3.5}
+
+
+def test_split_unknown_bids():
+    """
+    Bids that are not in the maping or in the
+    collection of bids raise a KeyError
+    """
+    bm = BidManager()
+    bm.add_bids([1, 3, 2], [1, 1, 2], [0, 1, 2])
+    bids = bm.get_df()
+    tm = TransactionManager()
+    tm.add_transaction(0, 2, 1, -1, False)
+
+    with pytest.raises(KeyError):
+        split_transactions_merged_players(tm, bids, {0: [0, 5]})
+    with pytest.raises(KeyError):
+        split_transactions_merged_players(tm, bids, {1: [0, 1]})
+    with pytest.raises(KeyError):
+        split_transactions_merged_players(tm, bids, ([0], []))
+    with pytest.raises(KeyError):
+        split_transactions_merged_players(
+            tm, bids, {0: [0, 1], 2: [2]}, {1: 1.0})